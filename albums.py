@@ -1,5 +1,7 @@
 """Album operations for KFJC Trivia Robot."""
 
+from typing import List
+
 from model import db, connect_to_db, Album
 
 
@@ -26,6 +28,17 @@ def get_album_by_id(kfjc_album_id: int) -> Album:
     return Album.query.get(kfjc_album_id)
 
 
+def get_albums_by_ids(kfjc_album_ids: List[int]) -> List[Album]:
+    """Return albums by primary key, in the order asked, in one query."""
+
+    found = {
+        album.kfjc_album_id: album for album in Album.query.filter(
+            Album.kfjc_album_id.in_(kfjc_album_ids))}
+    return [
+        found[kfjc_album_id] for kfjc_album_id in kfjc_album_ids
+        if kfjc_album_id in found]
+
+
 if __name__ == '__main__':
     """Will connect you to the database when you run albums.py interactively"""
     from server import app
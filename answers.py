@@ -1,13 +1,14 @@
 """Answer operations for KFJC Trivia Robot."""
 
+import hashlib
+import itertools
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 from random import choice
-from operator import itemgetter
-from sqlalchemy.sql.expression import false, true
-from typing import Union, NamedTuple, List, Any
+from typing import Union, NamedTuple, List, Any, Optional
 
-from model import db, connect_to_db, Answer, Question, User
-import users
+from model import db, connect_to_db, Answer, Question, User, UserScore
+import questions
 import common
 
 PRAISE_MSG = [
@@ -20,6 +21,8 @@ CONSOLATION_MSG = [
 INFO_MSG = [
     "Here's what I found:", "I found these:", "Here's your answer:",
     "My databanks say:", "I computed these results:", "Paper Tape confirms:"]
+LEADERBOARD_SECONDS = 30  # Longest a leaderboard snapshot is served...
+LEADERBOARD_ANSWERS = 25  # ...or until this many answers come in.
 
 
 def create_answer(
@@ -35,11 +38,62 @@ def create_answer(
         timestamp=datetime.now())
 
     db.session.add(user_answer)
-    # Don't forget to call model.db.session.commit() when done adding items.
+    count_answer(
+        user_id=user_instance.user_id,
+        answer_correct=user_answer.answer_correct)
+    # Don't forget to call model.db.session.commit() when done adding items,
+    # then answer_committed(user_answer).
 
     return user_answer
 
 
+def answer_committed(answer: Answer):
+    """Tell the in-memory leaderboard count and unseen-question bitmaps,
+    once the answer is safely in the database."""
+
+    answer_added()
+    questions.unseen_questions.remember(
+        user_id=answer.user_id, question_id=answer.question_id)
+
+
+def count_answer(user_id: int, answer_correct: Optional[bool]):
+    """Add one answer to the user's row in user_scores.
+
+    Same session as the answer, so both land in the same commit. The
+    increment happens in the UPDATE itself: no lost counts when two
+    requests race."""
+
+    passed = int(answer_correct is True)
+    failed = int(answer_correct is False)
+    skipped = int(answer_correct is None)
+    db.session.execute(
+        f"""INSERT INTO user_scores (user_id, passed, failed, skipped)
+        VALUES ({int(user_id)}, {passed}, {failed}, {skipped})
+        ON CONFLICT (user_id) DO UPDATE SET
+            passed = user_scores.passed + EXCLUDED.passed,
+            failed = user_scores.failed + EXCLUDED.failed,
+            skipped = user_scores.skipped + EXCLUDED.skipped;""")
+
+
+def rebuild_user_scores():
+    """Recount user_scores from the answers table.
+
+    Run after copying answers in by hand (weekly_db_update.md, Step 4)."""
+
+    db.session.execute("DELETE FROM user_scores;")
+    db.session.execute(
+        """INSERT INTO user_scores (user_id, passed, failed, skipped)
+        SELECT answers.user_id,
+            COUNT(*) FILTER (WHERE answers.answer_correct),
+            COUNT(*) FILTER (WHERE NOT answers.answer_correct),
+            COUNT(*) FILTER (WHERE answers.answer_correct IS NULL)
+        FROM answers
+        JOIN users ON (users.user_id = answers.user_id)
+        GROUP BY answers.user_id;""")
+    db.session.commit()
+    leaderboard.clear()
+
+
 def get_user_msg(answer: Answer) -> str:
     """Craft a message for the user about their answer."""
     if answer.answer_correct:
@@ -65,18 +119,19 @@ def is_answer_correct(
 def percent_correct(passed_count: int, failed_count: int) -> float:
     """For scorekeeping, leaderboards.
 
+    Halves round up, the same as ROUND() in get_scores:
     >>> percent_correct(0, 0)
     0.0
     >>> percent_correct(20, 80)
     20.0
+    >>> percent_correct(1, 15)
+    6.3
     """
 
-    try:
-        percent = round(
-            float(passed_count) * 100 / (passed_count + failed_count), 1)
-    except ZeroDivisionError:
-        percent = 0.0
-    return percent
+    if passed_count + failed_count == 0:
+        return 0.0
+    percent = Decimal(passed_count * 100) / (passed_count + failed_count)
+    return float(percent.quantize(Decimal('0.1'), rounding=ROUND_HALF_UP))
 
 
 def get_one_users_answers(user_id: int) -> Answer:
@@ -86,37 +141,102 @@ def get_one_users_answers(user_id: int) -> Answer:
 
 
 def get_user_score(user_id: int) -> NamedTuple:
-    """Return user play stats."""
-
-    passed = Answer.query.filter(
-        Answer.user_id == user_id, Answer.answer_correct == true()).count()
-    failed = Answer.query.filter(
-        Answer.user_id == user_id, Answer.answer_correct == false()).count()
-    skipped = Answer.query.filter(
-        Answer.user_id == user_id, Answer.answer_correct.is_(None)).count()
-    questions = passed + failed + skipped
-    percent = percent_correct(passed_count=passed, failed_count=failed)
+    """Return user play stats: one user_scores lookup."""
+
+    user_score = db.session.query(
+        UserScore.passed, UserScore.failed, UserScore.skipped).filter(
+        UserScore.user_id == user_id).first()
+    passed, failed, skipped = user_score or (0, 0, 0)
     scores = {
         'passed': passed, 'failed': failed, 'skipped': skipped,
-        'questions': questions, 'percent': percent}
+        'questions': passed + failed + skipped,
+        'percent': percent_correct(
+            passed_count=passed, failed_count=failed)}
     return common.convert_dict_to_named_tuple(scores)
 
 
-def compile_leaderboard() -> List[Any]:
-    """Return stats for all users."""
+def get_scores(top_n: Optional[int] = None) -> List[NamedTuple]:
+    """Play stats for every user, best percent first, from user_scores.
+
+    top_n: just the leaders.
+    Percent matches percent_correct, rounding and all: skips don't count
+    against you."""
+
+    leaders_only = ""
+    if top_n:
+        leaders_only = f"LIMIT {int(top_n)}"
+    tallies = (
+        """SELECT users.user_id, users.username, users.fname,
+        COALESCE(user_scores.passed, 0) AS passed,
+        COALESCE(user_scores.failed, 0) AS failed,
+        COALESCE(user_scores.skipped, 0) AS skipped
+        FROM users
+        LEFT JOIN user_scores ON (user_scores.user_id = users.user_id) """)
+    scores = (
+        f"""SELECT tallies.*,
+        tallies.passed + tallies.failed + tallies.skipped AS questions,
+        CAST(COALESCE(ROUND(
+            100.0 * tallies.passed /
+            NULLIF(tallies.passed + tallies.failed, 0), 1), 0) AS FLOAT)
+            AS percent
+        FROM ({tallies}) tallies
+        ORDER BY percent DESC, tallies.user_id
+        {leaders_only} """)
+
+    results = db.session.execute(scores)
+    return common.convert_list_o_dicts_to_list_o_named_tuples(results)
+
+
+def compile_leaderboard(
+        top_n: Optional[int] = None,
+        scores: Optional[List[NamedTuple]] = None) -> List[Any]:
+    """Return stats for all users, or the top_n of them.
 
-    score_board = []
+    scores: from a leaderboard snapshot, best first; else queried."""
 
-    for user in users.get_users():
-        user_id = user.user_id
-        user_score_named_tuple = get_user_score(user_id=user_id)
-        user_percent = user_score_named_tuple.percent
-        score_board.append(
-            [user_id, user_percent, f"{user_percent}% {user.fname}"])
+    if scores is None:
+        scores = get_scores(top_n=top_n)
+    return [
+        [score.user_id, score.percent, f"{score.percent}% {score.fname}"]
+        for score in scores[:top_n]]
 
-    score_board.sort(key=itemgetter(1), reverse=True)
 
-    return score_board
+# -=-=-=-=-=-=-=-=-=-=-=- Leaderboard Snapshot -=-=-=-=-=-=-=-=-=-=-=-
+
+
+class Leaderboard(NamedTuple):
+    scores: List[NamedTuple]  # get_scores(), best percent first.
+    etag: str  # Changes only when the scores do.
+    last_modified: datetime  # UTC, whole seconds, for Last-Modified.
+
+
+def take_leaderboard_snapshot() -> Leaderboard:
+    """One Leaderboard shared by /leaderboard and /rest_leaderboard.
+
+    Retaken after LEADERBOARD_SECONDS or LEADERBOARD_ANSWERS new
+    answers, whichever comes first. A retake that finds the same scores
+    keeps the old etag and last_modified, so polls still get a 304.
+    """
+    scores = get_scores()
+    etag = hashlib.sha1(
+        repr([tuple(score) for score in scores]).encode()).hexdigest()
+    last_snapshot = leaderboard.value
+    if last_snapshot is not None and last_snapshot.etag == etag:
+        return last_snapshot
+    return Leaderboard(
+        scores=scores, etag=etag,
+        last_modified=datetime.utcnow().replace(microsecond=0))
+
+
+leaderboard = common.SharedCache(
+    load=take_leaderboard_snapshot, max_seconds=LEADERBOARD_SECONDS)
+answers_counted = itertools.count(1)
+
+
+def answer_added():
+    """Retake the leaderboard every LEADERBOARD_ANSWERS answers."""
+    if next(answers_counted) % LEADERBOARD_ANSWERS == 0:
+        leaderboard.expire()
 
 
 if __name__ == '__main__':
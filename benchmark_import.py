@@ -0,0 +1,211 @@
+"""Benchmark the Station Data import engines.
+
+Makes synthetic station csv files at some multiple of test_data's size,
+imports them with any engine in seed_database.IMPORT_ENGINES and reports
+rows per second per table, peak memory and the number of commits.
+
+    python3 benchmark_import.py --scale 100 --engine copy
+    python3 benchmark_import.py --scale 10 --engine orm --db sqlite:////tmp/bench.db
+
+The COPY engines need PostgreSQL; the orm engine runs on SQLite too.
+Make the PostgreSQL database first: createdb trivia_benchmark
+"""
+
+import os
+import csv
+import time
+import resource
+import argparse
+from typing import List, Dict, Any, Iterator
+
+from sqlalchemy import event
+
+from server import app
+from model import db, connect_to_db
+import import_station_data as kfjc
+import seed_database
+
+TEST_DATA_FOLDER = 'test_data/station_data'
+BENCHMARK_DATA_FOLDER = 'benchmark_data'
+BENCHMARK_DB_URI = 'postgresql:///trivia_benchmark'
+
+# Which kfjc_album_id / kfjc_playlist_id columns need fresh ids in each copy
+# of the test data. user.csv is copied once; the station has ~500 djs.
+ID_COLUMNS = {
+    'album.csv': [0],
+    'playlist.csv': [0],
+    'playlist_track.csv': [0, 6],
+    'coll_track.csv': [0],
+    'track.csv': [0]}
+ID_STRIDE = 1000000  # Bigger than any id in test_data.
+
+# Path setting in import_station_data -> file name
+DATA_FILES = {
+    'DJ_DATA_PATH': 'user.csv',
+    'ALBUM_DATA_PATH': 'album.csv',
+    'PLAYLIST_DATA_PATH': 'playlist.csv',
+    'PLAYLIST_TRACK_DATA_PATH': 'playlist_track.csv',
+    'COLLECTION_TRACK_DATA_PATH': 'coll_track.csv',
+    'TRACK_DATA_PATH': 'track.csv'}
+STATION_TABLES = ['djs', 'albums', 'playlists', 'playlist_tracks', 'tracks']
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- Make Synthetic Station Data -=-=-=-=-=-=-=-=-=-=-=-
+
+
+def generate_station_data(scale: int) -> str:
+    """Write scale copies of each test_data csv file; return the folder."""
+
+    folder = os.path.join(BENCHMARK_DATA_FOLDER, f"x{scale}")
+    os.makedirs(folder, exist_ok=True)
+    for file_name in DATA_FILES.values():
+        with open(os.path.join(TEST_DATA_FOLDER, file_name), 'r') as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            rows = list(reader)
+        copies = scale if file_name in ID_COLUMNS else 1
+        with open(os.path.join(folder, file_name), 'w') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            for copy_number in range(copies):
+                writer.writerows(copy_rows(
+                    rows=rows, id_columns=ID_COLUMNS.get(file_name, []),
+                    copy_number=copy_number))
+    return folder
+
+
+def copy_rows(
+        rows: List[List[str]], id_columns: List[int],
+        copy_number: int) -> Iterator[List[str]]:
+    """The same rows with their ids moved into copy_number's own range.
+
+    >>> list(copy_rows([['214', 'Trinity', '0']], [0, 2], 3))
+    [['3000214', 'Trinity', '0']]
+    """
+    for row in rows:
+        row = list(row)
+        for column in id_columns:
+            if column < len(row):
+                row[column] = shift_id(
+                    cell=row[column], shift=copy_number * ID_STRIDE)
+        yield row
+
+
+def shift_id(cell: str, shift: int) -> str:
+    """Move a positive id; leave 0, NULL and the like alone.
+
+    >>> shift_id('214', 2000000)
+    '2000214'
+    >>> shift_id('0', 2000000)
+    '0'
+    >>> shift_id('NULL', 2000000)
+    'NULL'
+    """
+    try:
+        kfjc_id = int(cell)
+    except ValueError:
+        return cell
+    if kfjc_id <= 0:
+        return cell
+    return str(kfjc_id + shift)
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- Run and Measure an Engine -=-=-=-=-=-=-=-=-=-=-=-
+
+
+def run_benchmark(
+        engine: str, scale: int, db_uri: str = BENCHMARK_DB_URI
+) -> Dict[str, Any]:
+    """Import scale-sized synthetic data into an empty database."""
+
+    import_all_tables = seed_database.IMPORT_ENGINES[engine]
+    folder = generate_station_data(scale=scale)
+    for path_setting, file_name in DATA_FILES.items():
+        setattr(kfjc, path_setting, os.path.join(folder, file_name))
+
+    connect_to_db(flask_app=app, db_uri=db_uri, echo=False)
+    db.drop_all()
+    db.create_all()
+
+    commits = []
+    event.listen(db.engine, 'commit', lambda conn: commits.append(1))
+    seconds_per_file = time_each_file()
+
+    tic = time.perf_counter()
+    import_all_tables()
+    toc = time.perf_counter()
+
+    return {
+        'engine': engine,
+        'scale': scale,
+        'folder': folder,
+        'seconds': toc - tic,
+        'seconds_per_file': seconds_per_file,
+        'rows_per_table': count_rows(),
+        'commits': len(commits),
+        'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+        'peak_worker_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN)}
+
+
+def time_each_file() -> Dict[str, float]:
+    """Clock the time spent on each csv file, from its first chunk to its
+    last, including whatever the engine does with the chunks. Every read
+    counts, the missing-parent pre-pass too."""
+
+    seconds_per_file = {}
+    read_raw_chunks = kfjc.read_raw_chunks
+
+    def timed_read_raw_chunks(file_path: str, *args, **kwargs):
+        tic = time.perf_counter()
+        try:
+            yield from read_raw_chunks(file_path, *args, **kwargs)
+        finally:
+            file_name = os.path.basename(file_path)
+            seconds_per_file[file_name] = seconds_per_file.get(
+                file_name, 0) + time.perf_counter() - tic
+
+    kfjc.read_raw_chunks = timed_read_raw_chunks
+    return seconds_per_file
+
+
+def count_rows() -> Dict[str, int]:
+    return {
+        table_name: db.session.execute(
+            f"SELECT COUNT(*) FROM {table_name};").scalar()
+        for table_name in STATION_TABLES}
+
+
+def peak_rss_mb(who: int) -> float:
+    """ru_maxrss is in kilobytes on Linux."""
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def print_report(result: Dict[str, Any]):
+    print(
+        f"\n{result['engine']} engine at {result['scale']}x: "
+        f"{result['seconds']:0.2f} s, {result['commits']} commits, "
+        f"peak RSS {result['peak_rss_mb']:0.1f} MB "
+        f"(workers {result['peak_worker_rss_mb']:0.1f} MB)")
+    for file_name in DATA_FILES.values():
+        seconds = result['seconds_per_file'].get(file_name, 0)
+        with open(os.path.join(result['folder'], file_name), 'r') as file:
+            csv_rows = sum(1 for _ in csv.reader(file)) - 1
+        rate = csv_rows / seconds if seconds else 0
+        print(
+            f"  {file_name:<20} {csv_rows:>9} rows  {seconds:>8.2f} s  "
+            f"{rate:>10.0f} rows/s")
+    for table_name, row_count in result['rows_per_table'].items():
+        print(f"  {table_name:<20} {row_count:>9} rows loaded")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--engine', default='orm', choices=seed_database.IMPORT_ENGINES)
+    parser.add_argument(
+        '--scale', type=int, default=10, help="10, 100 or 1000 times test_data")
+    parser.add_argument('--db', default=BENCHMARK_DB_URI)
+    args = parser.parse_args()
+
+    print_report(run_benchmark(
+        engine=args.engine, scale=args.scale, db_uri=args.db))
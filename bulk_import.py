@@ -0,0 +1,416 @@
+"""Bulk Import Station Data with PostgreSQL COPY.
+
+Runs the same cleaning functions as import_station_data.py, but writes
+whole chunks of cleaned rows with COPY FROM STDIN instead of one ORM
+object (and sometimes one commit) per row.
+"""
+
+import io
+import os
+import csv
+import time
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional, NamedTuple
+
+from model import db
+import import_station_data as kfjc
+
+DJ_COLUMNS = ['dj_id', 'air_name', 'administrative', 'silent_mic']
+ALBUM_COLUMNS = ['kfjc_album_id', 'artist', 'title', 'is_collection']
+PLAYLIST_COLUMNS = [
+    'kfjc_playlist_id', 'dj_id', 'air_name', 'start_time', 'end_time']
+# The writer adds the last column of these two from its cache:
+PLAYLIST_TRACK_COLUMNS = [
+    'kfjc_playlist_id', 'indx', 'kfjc_album_id', 'album_title', 'artist',
+    'track_title', 'time_played']
+TRACK_COLUMNS = ['kfjc_album_id', 'title', 'indx', 'artist']
+
+CHUNKS_IN_FLIGHT_PER_WORKER = 2  # Keeps workers busy without reading ahead the whole file.
+
+
+class CopyRow(NamedTuple):
+    """One cleaned row, already in COPY's text format."""
+    key: Any  # The row's own id, or the id of the parent it borrows from.
+    value: Any  # What the cache remembers about key.
+    text: str  # Tab separated, no line break.
+
+
+class CleanChunk(NamedTuple):
+    """A chunk of a csv file, parsed and cleaned by clean_chunk."""
+    row_count: int  # Raw rows, for the checkpoint.
+    max_id: Optional[int]  # For the chunk manifest.
+    rows: List[CopyRow]
+
+
+class CopyBatch:
+    """Cleaned rows waiting to be copied, grouped by table.
+
+    Tables are written parents first so the foreign keys are satisfied.
+    """
+
+    def __init__(self):
+        # Everything we have written so far, to spot missing parents:
+        self.cache = kfjc.ImportCache()
+        self.rows = {
+            'djs': [], 'albums': [], 'playlists': [],
+            'playlist_tracks': [], 'tracks': []}
+
+    def add_dj(self, dj: CopyRow):
+        if dj.key in self.cache.dj_ids:
+            return
+        self.cache.dj_ids.add(dj.key)
+        self.rows['djs'].append(dj.text)
+
+    def add_album(self, album: CopyRow):
+        if album.key in self.cache.album_artists:
+            return
+        self.cache.album_artists[album.key] = album.value
+        self.rows['albums'].append(album.text)
+
+    def add_playlist(self, playlist: CopyRow):
+        if playlist.key in self.cache.playlist_start_times:
+            return
+        self.cache.playlist_start_times[playlist.key] = playlist.value
+        self.rows['playlists'].append(playlist.text)
+
+    def add_playlist_track(self, playlist_track: CopyRow):
+        # Borrow the playlist start_time, same as create_playlist_tracks:
+        time_played = self.cache.playlist_start_times.get(playlist_track.key)
+        self.rows['playlist_tracks'].append(
+            f"{playlist_track.text}\t{copy_text_value(time_played)}")
+
+    def add_collection_track(self, track: CopyRow):
+        self.rows['tracks'].append(track.text)
+
+    def add_track(self, track: CopyRow):
+        # Same as create_tracks:
+        artist = self.cache.album_artists.get(track.key)
+        self.rows['tracks'].append(f"{track.text}\t{copy_text_value(artist)}")
+
+    def add_missing_parents(self, missing_parents: Dict[str, List[List[Any]]]):
+        """Queue the dummy rows from kfjc.find_missing_parents."""
+        for row in missing_parents['djs']:
+            self.add_dj(dj_copy_row(kfjc.clean_dj_row(row=row)))
+        for row in missing_parents['albums']:
+            self.add_album(album_copy_row(kfjc.clean_album_row(row=row)))
+        for row in missing_parents['playlists']:
+            self.add_playlist(
+                playlist_copy_row(kfjc.clean_playlist_row(row=row)))
+
+    def flush(self):
+        """COPY every queued row, parents first, and commit."""
+        for table_name, columns in [
+                ('djs', DJ_COLUMNS),
+                ('albums', ALBUM_COLUMNS),
+                ('playlists', PLAYLIST_COLUMNS),
+                ('playlist_tracks', PLAYLIST_TRACK_COLUMNS),
+                ('tracks', TRACK_COLUMNS)]:
+            if self.rows[table_name]:
+                copy_rows(
+                    table_name=table_name, columns=columns,
+                    rows=self.rows[table_name])
+                self.rows[table_name] = []
+        db.session.commit()
+
+
+class IdAtLeast:
+    """Keeps the csv rows whose id column is at least mark.
+
+    A class rather than a lambda so the pool workers can unpickle it.
+
+    >>> IdAtLeast(column=0, mark=7)(['7', 'Album'])
+    True
+    >>> IdAtLeast(column=0, mark=7)(['6', 'Album'])
+    False
+    >>> IdAtLeast(column=6, mark=7)(['6', 'NULL'])
+    False
+    >>> IdAtLeast(column=0, mark=None)(['NULL'])
+    True
+    """
+
+    def __init__(self, column: int, mark: Optional[int]):
+        self.column = column
+        self.mark = mark
+
+    def __call__(self, row: List[str]) -> bool:
+        if self.mark is None:
+            return True  # Nothing loaded yet; keep everything.
+        try:
+            kfjc_id = kfjc.coerce_imported_data(row[self.column])
+        except IndexError:
+            return False
+        return isinstance(kfjc_id, int) and kfjc_id >= self.mark
+
+
+class IdIn:
+    """Keeps the csv rows whose id column is one of ids.
+
+    >>> IdIn(column=0, ids={7, 9})(['9', 'Album'])
+    True
+    >>> IdIn(column=0, ids={7, 9})(['8', 'Album'])
+    False
+    >>> IdIn(column=0, ids=None)(['8', 'Album'])
+    True
+    """
+
+    def __init__(self, column: int, ids: Optional[set]):
+        self.column = column
+        self.ids = ids
+
+    def __call__(self, row: List[str]) -> bool:
+        if self.ids is None:
+            return True  # Nothing loaded yet; keep everything.
+        try:
+            return kfjc.coerce_imported_data(row[self.column]) in self.ids
+        except IndexError:
+            return False
+
+
+def import_all_tables_with_pipeline(resume: bool = False):
+    """Import Station Data with COPY, parsing and cleaning on every core."""
+    import_all_tables_with_copy(max_workers=os.cpu_count(), resume=resume)
+
+
+def import_all_tables_with_copy(max_workers: int = 1, resume: bool = False):
+    """Import Station Data from csv files with COPY FROM STDIN.
+
+    With more than one worker, chunks are parsed, cleaned and formatted
+    in a process pool while this process copies the chunks that are
+    ready.
+    resume=True picks each file up after its last committed chunk.
+    """
+    copy_station_data(marks=None, max_workers=max_workers, resume=resume)
+
+
+def import_new_rows_with_copy(max_workers: int = 1):
+    """Import only the Station Data that is new since the last import.
+
+    Djs are merged; albums that changed are merged and albums we don't
+    have are added; the last show and the last album with tracks are
+    reloaded along with everything after them. Edits to older shows, and
+    tracks added to older albums, are not picked up.
+    users, questions and answers are never touched.
+    """
+    marks = kfjc.get_high_water_marks()
+    print(
+        f"Reloading shows from {marks.kfjc_playlist_id} and tracks from "
+        f"album {marks.track_album_id}; "
+        f"{len(marks.new_album_ids)} new albums.")
+    kfjc.forget_rows_from(marks=marks)
+    copy_station_data(marks=marks, max_workers=max_workers)
+
+
+def copy_station_data(
+        marks: Optional[kfjc.HighWaterMarks], max_workers: int = 1,
+        resume: bool = False):
+    """COPY the station csv files; with marks, only rows past them."""
+
+    delta = marks is not None
+    if marks is None:
+        marks = kfjc.HighWaterMarks(None, None, None)
+
+    # Albums and Playlists must be imported first since
+    # the other tables depend on them:
+    data_path_and_function = [
+        (kfjc.ALBUM_DATA_PATH, kfjc.clean_album_row, album_copy_row,
+         CopyBatch.add_album, IdIn(column=0, ids=marks.new_album_ids)),
+        (kfjc.PLAYLIST_DATA_PATH, kfjc.clean_playlist_row,
+         playlist_copy_row, CopyBatch.add_playlist,
+         IdAtLeast(column=0, mark=marks.kfjc_playlist_id)),
+        (kfjc.PLAYLIST_TRACK_DATA_PATH, kfjc.clean_playlist_track_row,
+         playlist_track_copy_row, CopyBatch.add_playlist_track,
+         IdAtLeast(column=0, mark=marks.kfjc_playlist_id)),
+        (kfjc.COLLECTION_TRACK_DATA_PATH, kfjc.clean_collection_track_row,
+         collection_track_copy_row, CopyBatch.add_collection_track,
+         IdAtLeast(column=0, mark=marks.track_album_id)),
+        (kfjc.TRACK_DATA_PATH, kfjc.clean_track_row, track_copy_row,
+         CopyBatch.add_track,
+         IdAtLeast(column=0, mark=marks.track_album_id))]
+
+    tic = time.perf_counter()
+    executor = None
+    if max_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    max_in_flight = max_workers * CHUNKS_IN_FLIGHT_PER_WORKER
+    batch = CopyBatch()
+    kfjc.begin_import(cache=batch.cache, resume=resume, delta=delta)
+    try:
+        if batch.cache.dj_ids:
+            kfjc.merge_djs(cache=batch.cache)
+        else:
+            copy_a_large_csv(
+                file_path=kfjc.DJ_DATA_PATH, row_cleaner=kfjc.clean_dj_row,
+                row_copier=dj_copy_row, batch_adder=CopyBatch.add_dj,
+                batch=batch, executor=executor, max_in_flight=max_in_flight)
+        if delta:
+            kfjc.merge_albums(cache=batch.cache)
+        # Every parent the other tables point at will exist before they load:
+        batch.add_missing_parents(
+            missing_parents=kfjc.find_missing_parents(
+                cache=batch.cache, executor=executor,
+                max_in_flight=max_in_flight))
+        batch.flush()
+        for each_tuple in data_path_and_function:
+            # unpack:
+            file_path, row_cleaner, row_copier, batch_adder, keep_row = (
+                each_tuple)
+            copy_a_large_csv(
+                file_path=file_path, row_cleaner=row_cleaner,
+                row_copier=row_copier, batch_adder=batch_adder, batch=batch,
+                executor=executor, max_in_flight=max_in_flight,
+                keep_row=keep_row)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    toc = time.perf_counter()
+    minutes = float((toc - tic) / 60)
+    print(f"Copying Station Data took {minutes:0.4f} minutes.")
+
+
+def copy_a_large_csv(
+        file_path: str, row_cleaner: Callable, row_copier: Callable,
+        batch_adder: Callable, batch: CopyBatch,
+        executor: Optional[Executor] = None, max_in_flight: int = 1,
+        keep_row: Optional[Callable] = None):
+    """Clean each chunk of a CSV file and COPY it in one go.
+
+    Chunks whose bytes were loaded before are skipped. With an executor,
+    the pool parses, cleans and formats the chunks; this process only
+    checkpoints them and runs the COPY."""
+
+    chunks = kfjc.read_changed_chunks(file_path=file_path, cache=batch.cache)
+    for chunk, clean in kfjc.map_chunks(
+            function=functools.partial(
+                clean_chunk, row_cleaner, row_copier, keep_row),
+            chunks=chunks, executor=executor, max_in_flight=max_in_flight):
+        print(f"\n\nNow copying {file_path}, Chunk {chunk.number}:")
+        for copy_row in clean.rows:
+            batch_adder(batch, copy_row)
+        kfjc.record_chunk(
+            chunk=chunk, row_count=clean.row_count, max_id=clean.max_id,
+            cache=batch.cache, file_path=file_path)
+        batch.flush()  # Commit after each large chunk.
+
+
+def clean_chunk(
+        row_cleaner: Callable, row_copier: Callable,
+        keep_row: Optional[Callable], lines: List[str]) -> CleanChunk:
+    """Parse a chunk of csv lines, drop the rows not worth importing
+    (and, with keep_row, the ones it doesn't want) and format the rest
+    for COPY.
+
+    Runs in the pool workers, so it has to stay a module-level function.
+
+    >>> clean = clean_chunk(
+    ...     kfjc.clean_collection_track_row, collection_track_copy_row,
+    ...     None, ['397830,Jolene,"Parton, Dolly",1', '397830'])
+    >>> clean.row_count, clean.max_id
+    (2, 397830)
+    >>> [copy_row.text for copy_row in clean.rows]
+    ['397830\\tJolene\\t1\\tDolly Parton']
+    """
+    rows = list(csv.reader(lines))
+    kept_rows = rows
+    if keep_row:
+        kept_rows = [row for row in rows if keep_row(row)]
+    return CleanChunk(
+        row_count=len(rows), max_id=kfjc.max_kfjc_id(rows=rows),
+        rows=[
+            row_copier(cleaned_row)
+            for cleaned_row in map(row_cleaner, kept_rows) if cleaned_row])
+
+
+def copy_line(row: Dict[str, Any], columns: List[str]) -> str:
+    """One cleaned row in COPY's text format, without the line break."""
+    return "\t".join(copy_text_value(row[column]) for column in columns)
+
+
+# What the writer needs to know about each table's cleaned rows.
+# Module-level so the pool workers can unpickle them:
+
+
+def dj_copy_row(dj: Dict[str, Any]) -> CopyRow:
+    return CopyRow(
+        key=dj['dj_id'], value=None, text=copy_line(dj, DJ_COLUMNS))
+
+
+def album_copy_row(album: Dict[str, Any]) -> CopyRow:
+    return CopyRow(
+        key=album['kfjc_album_id'], value=album['artist'],
+        text=copy_line(album, ALBUM_COLUMNS))
+
+
+def playlist_copy_row(playlist: Dict[str, Any]) -> CopyRow:
+    return CopyRow(
+        key=playlist['kfjc_playlist_id'], value=playlist['start_time'],
+        text=copy_line(playlist, PLAYLIST_COLUMNS))
+
+
+def playlist_track_copy_row(playlist_track: Dict[str, Any]) -> CopyRow:
+    # The writer adds time_played:
+    return CopyRow(
+        key=playlist_track['kfjc_playlist_id'], value=None,
+        text=copy_line(playlist_track, PLAYLIST_TRACK_COLUMNS[:-1]))
+
+
+def collection_track_copy_row(track: Dict[str, Any]) -> CopyRow:
+    return CopyRow(key=None, value=None, text=copy_line(track, TRACK_COLUMNS))
+
+
+def track_copy_row(track: Dict[str, Any]) -> CopyRow:
+    # The writer adds the album artist:
+    return CopyRow(
+        key=track['kfjc_album_id'], value=None,
+        text=copy_line(track, TRACK_COLUMNS[:-1]))
+
+
+def copy_rows(table_name: str, columns: List[str], rows: List[str]):
+    """Stream rows, already in COPY's text format, into a table with
+    COPY FROM STDIN."""
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(row)
+        buffer.write("\n")
+    buffer.seek(0)
+
+    # Ride along in the session's transaction:
+    with db.session.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def copy_text_value(value: Any) -> str:
+    r"""Format one value for COPY's text format.
+
+    >>> copy_text_value(None)
+    '\\N'
+    >>> copy_text_value(True)
+    't'
+    >>> copy_text_value(27)
+    '27'
+    >>> copy_text_value("Tab\there\\")
+    'Tab\\there\\\\'
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).replace(
+        "\\", "\\\\").replace("\t", "\\t").replace(
+        "\n", "\\n").replace("\r", "\\r")
+
+
+if __name__ == "__main__":
+    from server import app
+    from model import connect_to_db
+
+    connect_to_db(app)
+
+    import doctest
+
+    doctest.testmod()  # python3 bulk_import.py -v
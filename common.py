@@ -1,9 +1,12 @@
 """Common operations for KFJC Trivia Robot."""
 
 import json
+import time
+import threading
+import traceback
 import collections
 from datetime import datetime, date  # date is used in a doctest.
-from typing import List, Dict, Any, NamedTuple, Union
+from typing import List, Dict, Any, NamedTuple, Union, Callable, Optional
 import sqlalchemy
 from sqlalchemy.sql.expression import func, distinct
 
@@ -139,13 +142,26 @@ def open_json_files(file_path: str) -> List[Dict[str, Any]]:
 
 def convert_list_o_dicts_to_list_o_named_tuples(
         list_of_dicts: List[Dict[str, Any]]) -> List[NamedTuple]:
-    """After conversion, you'll be able to use dot notation on your data."""
+    """After conversion, you'll be able to use dot notation on your data.
+
+    Rows with the same keys share one namedtuple class; making a class
+    costs far more than making a tuple.
+
+    >>> rows = convert_list_o_dicts_to_list_o_named_tuples(
+    ...     [{'artist': 'Delixx', 'plays': 6}, {'artist': 'Can', 'plays': 2}])
+    >>> rows[1].artist, type(rows[0]) is type(rows[1])
+    ('Can', True)
+    """
 
     list_of_named_tuples = []
+    generic_dict = None
 
     for each_dict in list_of_dicts:
-        converteted_dicts = convert_dict_to_named_tuple(each_dict)
-        list_of_named_tuples.append(converteted_dicts)
+        if generic_dict is None or (
+                generic_dict._fields != tuple(each_dict.keys())):
+            generic_dict = collections.namedtuple(
+                'GenericDict', each_dict.keys())
+        list_of_named_tuples.append(generic_dict(**each_dict))
 
     return list_of_named_tuples
 
@@ -156,6 +172,83 @@ def convert_dict_to_named_tuple(a_dict: Dict[str, Any]) -> NamedTuple:
     return collections.namedtuple('GenericDict', a_dict.keys())(**a_dict)
 
 
+# -=-=-=-=-=-=-=-=-=-=-=- Shared Caches -=-=-=-=-=-=-=-=-=-=-=-
+
+
+class SharedCache:
+    """A value every request thread shares, made by load() on first use.
+
+    Once it is max_seconds old, or after expire(), the next get() starts
+    a reload on a background thread and keeps handing out the old value
+    until the new one is swapped in; no request waits for a rebuild.
+    Only the very first load, and the first after clear(), is waited for.
+    """
+
+    def __init__(
+            self, load: Callable[[], Any], max_seconds: Optional[float] = None):
+        self.load = load
+        self.max_seconds = max_seconds
+        self.value = None
+        self.loaded_at = None  # None: nothing loaded yet.
+        self.stale = False
+        self.reloading = False
+        self.generation = 0  # A reload started before clear() is dropped.
+        self.lock = threading.Lock()  # The dev server is threaded.
+
+    def get(self) -> Any:
+        with self.lock:
+            if self.loaded_at is None:
+                self.keep(self.load())
+            elif not self.reloading and (self.stale or (
+                    self.max_seconds is not None and
+                    time.monotonic() - self.loaded_at > self.max_seconds)):
+                self.reloading = True
+                threading.Thread(
+                    target=self.reload, args=(self.generation,),
+                    daemon=True).start()
+            return self.value
+
+    def refresh(self) -> Any:
+        """Load it now, in this thread. Readers keep the old value until
+        the new one is ready."""
+        value = self.load()
+        with self.lock:
+            self.generation += 1
+            self.keep(value)
+            return value
+
+    def expire(self):
+        """Reload on the next get(), in the background."""
+        self.stale = True
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.value = None
+            self.loaded_at = None
+
+    def keep(self, value: Any):
+        """Call with the lock held."""
+        self.value = value
+        self.loaded_at = time.monotonic()
+        self.stale = False
+
+    def reload(self, generation: int):
+        try:
+            value = self.load()
+        except Exception:  # Keep the old value; the next get() tries again.
+            traceback.print_exc()
+            with self.lock:
+                self.reloading = False
+            return
+        finally:
+            db.session.remove()  # This thread's own session.
+        with self.lock:
+            if generation == self.generation:
+                self.keep(value)
+            self.reloading = False
+
+
 if __name__ == '__main__':
     """Will connect you to the database when you run common.py interactively"""
     from server import app
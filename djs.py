@@ -1,9 +1,14 @@
 """DJ operations for KFJC Trivia Robot."""
 
+from types import MappingProxyType
+from typing import NamedTuple, Mapping, Tuple, Dict, Any
+
 from model import db, connect_to_db, Dj
+import playlists
 import common
 
 WHITE_HEART = '♡'
+DJ_DIRECTORY_SECONDS = 3600  # How often the server rebuilds it.
 
 
 def create_dj(
@@ -33,23 +38,124 @@ def get_airname_for_dj(dj_id: int, posessive: bool = False) -> str:
     """Return an air_name by primary key."""
 
     dj = Dj.query.get(dj_id)
-    air_name = dj.air_name
-    if dj.silent_mic:
+    return format_air_name(
+        air_name=dj.air_name, silent_mic=dj.silent_mic, posessive=posessive)
+
+
+def format_air_name(
+        air_name: str, silent_mic: bool, posessive: bool = False) -> str:
+    """
+    >>> format_air_name("Art Crimes", silent_mic=False, posessive=True)
+    "Art Crimes'"
+    >>> format_air_name("Cy Thoth", silent_mic=True)
+    '♡ Cy Thoth ♡'
+    >>> format_air_name("Cy Thoth", silent_mic=True, posessive=True)
+    "♡ Cy Thoth's ♡"
+    """
+    if posessive and air_name:
+        air_name += common.the_right_apostrophe(air_name=air_name)
+    if silent_mic:
         # Add white hearts for our DJs that have passed on:
-        if posessive:
-            suffix = common.the_right_apostrophe(air_name=air_name)
-            return (
-                f"{WHITE_HEART} {dj.air_name}{suffix} "
-                f"{WHITE_HEART}")
-
-        else:
-            return f"{WHITE_HEART} {dj.air_name} {WHITE_HEART}"
-    else:
-        if posessive:
-            suffix = common.the_right_apostrophe(air_name=air_name)
-            return dj.air_name + suffix
-        else:
-            return dj.air_name
+        return f"{WHITE_HEART} {air_name} {WHITE_HEART}"
+    return air_name
+
+
+class AirName(NamedTuple):
+    plain: str
+    posessive: str
+
+
+def get_all_airnames() -> Dict[int, AirName]:
+    """Every DJ's formatted air names in one query, for the question
+    engines that would otherwise call get_airname_for_dj row by row."""
+
+    return {
+        dj_id: AirName(
+            plain=format_air_name(air_name=air_name, silent_mic=silent_mic),
+            posessive=format_air_name(
+                air_name=air_name, silent_mic=silent_mic, posessive=True))
+        for dj_id, air_name, silent_mic in db.session.query(
+            Dj.dj_id, Dj.air_name, Dj.silent_mic)}
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- DJ Directory -=-=-=-=-=-=-=-=-=-=-=-
+
+
+class DjDirectory(NamedTuple):
+    """Prolific DJs for /ask, /dj_stats and the DJ questions.
+    Built whole and never changed; a refresh swaps in a new one."""
+    stats: Tuple[NamedTuple, ...]  # playlists.dj_stats rows, by air_name.
+    dj_dict: Mapping[int, Mapping[str, str]]  # dj_id -> pretty stats.
+    dj_airnames: Tuple[Tuple[int, str], ...]  # (dj_id, air_name) pairs.
+
+    def sorted_stats(
+            self, order_by: str, reverse: bool = False
+    ) -> Tuple[NamedTuple, ...]:
+        """stats ordered like playlists.get_djs_by_*() would.
+
+        By air_name is the order stats came out of the database in, so
+        it keeps the database's collation. Missing values go last, or
+        first when reversed, as in SQL.
+
+        >>> Stat = NamedTuple('Stat', [('air_name', str), ('lastshow', int)])
+        >>> directory = DjDirectory(stats=(
+        ...     Stat('Cy Thoth', 3), Stat('dr doug', None),
+        ...     Stat('Spliff Skankin', 7)), dj_dict={}, dj_airnames=())
+        >>> [zz.air_name for zz in directory.sorted_stats('lastshow')]
+        ['Cy Thoth', 'Spliff Skankin', 'dr doug']
+        >>> [zz.air_name for zz in directory.sorted_stats(
+        ...     'air_name', reverse=True)]
+        ['Spliff Skankin', 'dr doug', 'Cy Thoth']
+        """
+        if order_by == 'air_name':
+            if reverse:
+                return tuple(reversed(self.stats))
+            return self.stats
+        return tuple(sorted(
+            self.stats, key=lambda zz: nulls_last(getattr(zz, order_by)),
+            reverse=reverse))
+
+
+def nulls_last(value: Any) -> Tuple[bool, Any]:
+    """A sort key that puts None after everything else."""
+    return value is None, value
+
+
+def build_dj_directory() -> DjDirectory:
+    """One query for every prolific DJ; the rest is string work."""
+
+    stats = tuple(playlists.get_djs_alphabetically())
+    dj_dict = {}
+    for zz in stats:
+        air_name = format_air_name(
+            air_name=zz.air_name, silent_mic=zz.silent_mic)
+        air_name_posessive = format_air_name(
+            air_name=zz.air_name, silent_mic=zz.silent_mic, posessive=True)
+        showcount = common.format_an_int_with_commas(zz.showcount)
+        firstshow = common.make_date_pretty(zz.firstshow)
+        lastshow = common.make_date_pretty(zz.lastshow)
+        dj_stats = (
+            f"{air_name_posessive} first show was on {firstshow}, "
+            f"their last show was on {lastshow} and they have done "
+            f"{showcount} shows!")
+        dj_dict[zz.dj_id] = MappingProxyType({
+            'air_name': air_name,
+            'showcount': showcount,
+            'firstshow': firstshow,
+            'lastshow': lastshow,
+            'dj_stats': dj_stats})
+    return DjDirectory(
+        stats=stats,
+        dj_dict=MappingProxyType(dj_dict),
+        dj_airnames=tuple(
+            (dj_id, entry['air_name']) for dj_id, entry in dj_dict.items()))
+
+
+# Readers just take the current DjDirectory. make_all_questions refreshes
+# it; the server rebuilds it in the background every DJ_DIRECTORY_SECONDS,
+# so a weekly_update beside it shows up without a restart.
+dj_directory = common.SharedCache(
+    load=build_dj_directory, max_seconds=DJ_DIRECTORY_SECONDS)
 
 
 if __name__ == '__main__':
@@ -57,3 +163,7 @@ if __name__ == '__main__':
     from server import app
 
     connect_to_db(app)
+
+    import doctest
+
+    doctest.testmod()  # python3 djs.py -v
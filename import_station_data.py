@@ -1,15 +1,21 @@
 """Import Station Data from csv Files."""
 
+import os
 import re
 import csv
 import time
-import itertools
+import hashlib
+import functools
+from collections import deque
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
-from sqlalchemy.exc import IntegrityError
-from typing import List, Any, Callable, Optional
+from typing import (
+    List, Dict, Any, Callable, Optional, Iterator, NamedTuple, Tuple)
 
 from server import app
-from model import db, connect_to_db
+from model import (
+    db, connect_to_db, Dj, Album, Playlist, PlaylistTrack, Track, ImportedChunk,
+    ImportCheckpoint)
 import djs
 import playlists
 import playlist_tracks
@@ -24,6 +30,28 @@ DO_NOT_CHANGE = ['Listen, Whitey!  The Sounds of Black Power 1967-1974']
 
 SILENT_MIC = [210]  # When someone passes, it can be psychologically difficult to flip this bit.
 
+COERCED_CELL_CACHE_SIZE = 2 ** 17  # Artist and album names repeat a lot.
+
+THROWAWAY_TITLES = frozenset([
+    'NULL', "Null", '', " ", "?", ".", "..", "...", "*", "-", ",",
+    "\"", "None.", "None", "(None)", "none", "none."])
+
+PROFANITY_REPLACEMENTS = [
+    (r"[Ff][Uu][Cc][Kk]", "F&#129296;ck"),
+    (r"[Pp][Uu][Ss][Ss][Yy]", "P&#128576;ssy"),
+    (r"[Ss][Hh][Ii][Tt]", "Sh&#128169;t"),
+    (r"[Cc][Uu][Nn][Tt]", "C&#128576;nt"),
+    (r"[Aa][Ss][Ss][Hh][0Oo][Ll][Ee]", "A$$hole"),
+    (r"[Nn][Ii][Gg][Gg][Ee][Rr]", "N&#9994;&#127998;gger"),
+    (r"\[[Cc][Oo][Ll][Ll]\]:?", ""),
+    (r"\<[Cc][Oo][Ll][Ll]\>:?", ""),
+    (r"[Cc][Oo][Ll][Ll]:?\b", "")]
+# One scan per string: each pattern is a numbered group of one alternation.
+PROFANITY_REGEX = re.compile(
+    "|".join(f"({pat})" for pat, _ in PROFANITY_REPLACEMENTS))
+
+SELF_TITLED_REGEX = re.compile(r"(^|\s)(S|s)\/(T|t)\b")
+
 
 # Put dj_ids in here to help the process along.
 
@@ -69,8 +97,11 @@ def time_shift(one_datetime_cell: str, shift: int = 3) -> datetime:
             timedelta(hours=shift)).strftime('%Y-%m-%d %H:%M:%S')
 
 
+@functools.lru_cache(maxsize=COERCED_CELL_CACHE_SIZE)
 def coerce_imported_data(one_cell: Any) -> Any:
     """Coerce incoming data to the correct type.
+
+    Memoized on the raw cell; every answer is an immutable int, str or None.
     >>> coerce_imported_data('NULL')
     >>> coerce_imported_data('Null')
     >>> coerce_imported_data("")
@@ -91,11 +122,7 @@ def coerce_imported_data(one_cell: Any) -> Any:
     except (ValueError, TypeError):
         pass
 
-    throwaway_titles = [
-        'NULL', "Null", '', " ", "?", ".", "..", "...", "*", "-", ",",
-        "\"", "None.", "None", "(None)", "none", "none."]
-
-    if one_cell in throwaway_titles:  # + BAD_TIMES:
+    if one_cell in THROWAWAY_TITLES:  # + BAD_TIMES:
         return None  # No Data *IS* No Data.
     elif isinstance(one_cell, datetime):
         return datetime.fromisoformat(one_cell)
@@ -124,7 +151,8 @@ def fix_titles(some_title: str) -> str:
 
     some_title = profanity_filter(title_string=some_title)
 
-    if ", the" in some_title.lower() or ",the" in some_title.lower():
+    lower_title = some_title.lower()
+    if ", the" in lower_title or ",the" in lower_title:
         without_the = some_title.replace(
             ", the", "").replace(",the", "").replace(
             ", The", "").replace(",The", "")
@@ -167,20 +195,13 @@ def profanity_filter(title_string: str) -> str:
     'Collection'
     """
 
-    replacements = [
-        (r"[Ff][Uu][Cc][Kk]", "F&#129296;ck"),
-        (r"[Pp][Uu][Ss][Ss][Yy]", "P&#128576;ssy"),
-        (r"[Ss][Hh][Ii][Tt]", "Sh&#128169;t"),
-        (r"[Cc][Uu][Nn][Tt]", "C&#128576;nt"),
-        (r"[Aa][Ss][Ss][Hh][0Oo][Ll][Ee]", "A$$hole"),
-        (r"[Nn][Ii][Gg][Gg][Ee][Rr]", "N&#9994;&#127998;gger"),
-        (r"\[[Cc][Oo][Ll][Ll]\]:?", ""),
-        (r"\<[Cc][Oo][Ll][Ll]\>:?", ""),
-        (r"[Cc][Oo][Ll][Ll]:?\b", "")]
-    for pat, repl in replacements:
-        title_string = re.sub(pat, repl, title_string)
+    return PROFANITY_REGEX.sub(
+        profanity_replacement, title_string).strip()
+
 
-    return title_string.strip()
+def profanity_replacement(match: re.Match) -> str:
+    """The replacement for whichever PROFANITY_REPLACEMENTS group matched."""
+    return PROFANITY_REPLACEMENTS[match.lastindex - 1][1]
 
 
 # -=-=-=-=-=-=-=-=-=-=-=- Import the 5 CSV Files -=-=-=-=-=-=-=-=-=-=-=-
@@ -194,8 +215,98 @@ COLLECTION_TRACK_DATA_PATH = 'station_data/coll_track.csv'
 TRACK_DATA_PATH = 'station_data/track.csv'
 
 
-def create_djs(row: List[Any]):
-    """Add all djs rows."""
+class Checkpoint(NamedTuple):
+    """The last committed chunk of a csv file."""
+    chunk_number: int
+    byte_offset: int  # Where the next chunk starts.
+    row_count: int  # Rows loaded from the file up to here.
+    file_signature: str
+
+
+class ImportCache:
+    """Parent rows the import has already written.
+
+    Lets the row handlers borrow a playlist start_time or an album artist,
+    and spot a missing parent, without a database round-trip per row.
+    Also remembers which csv chunks are loaded, so a rerun can skip them,
+    and how far into each file a resumed import can jump.
+    """
+
+    def __init__(self):
+        self.dj_ids = set()
+        self.album_artists = {}  # kfjc_album_id -> artist
+        self.playlist_start_times = {}  # kfjc_playlist_id -> start_time
+        self.chunk_hashes = {}  # (file_name, chunk_number) -> content_hash
+        self.checkpoints = {}  # file_name -> Checkpoint
+        self.delta = False  # Rows past the high water marks only.
+
+    def preload(self):
+        """Pick up parent rows that are already in the database."""
+        self.dj_ids = {dj_id for dj_id, in db.session.query(Dj.dj_id)}
+        self.album_artists = dict(
+            db.session.query(Album.kfjc_album_id, Album.artist))
+        self.playlist_start_times = dict(
+            db.session.query(Playlist.kfjc_playlist_id, Playlist.start_time))
+        self.chunk_hashes = {
+            (file_name, chunk_number): content_hash
+            for file_name, chunk_number, content_hash in db.session.query(
+                ImportedChunk.file_name, ImportedChunk.chunk_number,
+                ImportedChunk.content_hash)}
+        self.checkpoints = {
+            file_name: Checkpoint(*checkpoint)
+            for file_name, *checkpoint in db.session.query(
+                ImportCheckpoint.file_name, ImportCheckpoint.chunk_number,
+                ImportCheckpoint.byte_offset, ImportCheckpoint.row_count,
+                ImportCheckpoint.file_signature)}
+
+    def has_dj(self, dj_id: int) -> bool:
+        return dj_id is None or dj_id in self.dj_ids
+
+    def has_album(self, kfjc_album_id: int) -> bool:
+        return kfjc_album_id is None or kfjc_album_id in self.album_artists
+
+    def has_playlist(self, kfjc_playlist_id: int) -> bool:
+        return (
+            kfjc_playlist_id is None or
+            kfjc_playlist_id in self.playlist_start_times)
+
+    def has_chunk(self, chunk: 'CsvChunk') -> bool:
+        return self.chunk_hashes.get(
+            (chunk.file_name, chunk.number)) == chunk.content_hash
+
+    def had_chunk(self, chunk: 'CsvChunk') -> bool:
+        """A chunk by this number was loaded, maybe with other bytes."""
+        return (chunk.file_name, chunk.number) in self.chunk_hashes
+
+    def resume_point(self, file_path: str) -> Optional[Checkpoint]:
+        """Where to pick a file back up, unless the file has changed."""
+        checkpoint = self.checkpoints.get(os.path.basename(file_path))
+        if checkpoint and checkpoint.file_signature == file_signature(
+                file_path=file_path):
+            return checkpoint
+        return None
+
+
+def begin_import(
+        cache: ImportCache, resume: bool = False, delta: bool = False):
+    """Load the cache. Unless resuming, old checkpoints are dropped so the
+    files are read from the top (loaded chunks are still skipped).
+
+    Only a delta import, which cleared out the rows it reloads, may read
+    a chunk that changed since it was loaded."""
+
+    if not resume:
+        ImportCheckpoint.query.delete()
+        db.session.commit()
+    cache.preload()
+    cache.delta = delta
+
+
+import_cache = ImportCache()
+
+
+def clean_dj_row(row: List[Any]) -> Dict[str, Any]:
+    """Clean one user.csv row into djs column values."""
 
     dj_id = coerce_imported_data(row[0])
     air_name = str(coerce_imported_data(row[2]))
@@ -214,24 +325,29 @@ def create_djs(row: List[Any]):
     if row[9] == 'Y' or dj_id in SILENT_MIC:  # (Sometimes they're not so quick to set this flag.)
         silent_mic = True  # For Djs that have escaped this mortal realm. 💀
 
-    djs.create_dj(
-        dj_id=dj_id,
-        air_name=air_name,
-        administrative=administrative,
-        silent_mic=silent_mic)
+    return {
+        'dj_id': dj_id,
+        'air_name': air_name,
+        'administrative': administrative,
+        'silent_mic': silent_mic}
+
+
+def create_djs(row: List[Any]):
+    """Add all djs rows."""
 
+    dj = djs.create_dj(**clean_dj_row(row=row))
+    import_cache.dj_ids.add(dj.dj_id)
 
-def add_a_missing_dj(dj_id: int, air_name: str):
-    """Add a dummy dj row to avoid import conflicts."""
+
+def missing_dj_row(dj_id: int, air_name: str) -> List[Any]:
+    """A dummy user.csv row for a dj_id that isn't in the station data."""
     if not air_name:
         air_name = "None"
-    create_djs(
-        row=[dj_id, None, air_name, None, None, None, None, None, None, "N"])
-    db.session.commit()
+    return [dj_id, None, air_name, None, None, None, None, None, None, "N"]
 
 
-def create_albums(row: List[Any]):
-    """Add all albums rows."""
+def clean_album_row(row: List[Any]) -> Dict[str, Any]:
+    """Clean one album.csv row into albums column values."""
 
     kfjc_album_id = coerce_imported_data(row[0])
     artist = str(coerce_imported_data(row[1]))
@@ -241,23 +357,29 @@ def create_albums(row: List[Any]):
     title, artist, _ = fix_self_titled_items(
         album_title=title, artist=artist, track_title=None)
 
-    albums.create_album(
-        kfjc_album_id=kfjc_album_id,
-        artist=artist,
-        title=title,
-        is_collection=is_collection)
+    return {
+        'kfjc_album_id': kfjc_album_id,
+        'artist': artist,
+        'title': title,
+        'is_collection': is_collection}
 
 
-def add_a_missing_album(kfjc_album_id: int, artist: str, album_title: str):
-    """Add a dummy album row to avoid import conflicts."""
+def create_albums(row: List[Any]):
+    """Add all albums rows."""
+
+    album = albums.create_album(**clean_album_row(row=row))
+    import_cache.album_artists[album.kfjc_album_id] = album.artist
 
-    row = [kfjc_album_id, artist, album_title, None, None, None, None, 1]
-    create_albums(row=row)
-    db.session.commit()
 
+def missing_album_row(
+        kfjc_album_id: int, artist: str, album_title: str) -> List[Any]:
+    """A dummy album.csv row for a kfjc_album_id that isn't in the
+    station data."""
+    return [kfjc_album_id, artist, album_title, None, None, None, None, 1]
 
-def create_playlists(row: List[Any]):
-    """Add all playlists rows."""
+
+def clean_playlist_row(row: List[Any]) -> Dict[str, Any]:
+    """Clean one playlist.csv row into playlists column values."""
 
     # If one time is blank but the other isn't,
     # we can improve the data by estimating the other time:
@@ -272,44 +394,27 @@ def create_playlists(row: List[Any]):
     if coerce_imported_data(row[2]) in ['Click', '^']:
         row[2] = 'DJ Click'  # Reassign it.
 
-    kfjc_playlist_id = coerce_imported_data(row[0])
-    dj_id = coerce_imported_data(row[1])
-    air_name = str(coerce_imported_data(row[2]))
-    start_time = coerce_imported_data(fixed_start_time)
-    end_time = coerce_imported_data(fixed_end_time)
-
-    playlists.create_playlist(
-        kfjc_playlist_id=kfjc_playlist_id,
-        dj_id=dj_id,
-        air_name=air_name,
-        start_time=start_time,
-        end_time=end_time)
-
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
+    return {
+        'kfjc_playlist_id': coerce_imported_data(row[0]),
+        'dj_id': coerce_imported_data(row[1]),
+        'air_name': str(coerce_imported_data(row[2])),
+        'start_time': coerce_imported_data(fixed_start_time),
+        'end_time': coerce_imported_data(fixed_end_time)}
 
-        # Fix rows that cause import trouble:
-        if not djs.get_dj_id_by_id(dj_id=dj_id):
-            add_a_missing_dj(dj_id=dj_id, air_name=air_name)
 
-        # And try again; it should go through now:
-        playlists.create_playlist(
-            kfjc_playlist_id=kfjc_playlist_id,
-            dj_id=dj_id,
-            air_name=air_name,
-            start_time=start_time,
-            end_time=end_time)
+def create_playlists(row: List[Any]):
+    """Add all playlists rows."""
 
-        db.session.commit()
+    playlist = clean_playlist_row(row=row)
+    playlists.create_playlist(**playlist)
+    import_cache.playlist_start_times[
+        playlist['kfjc_playlist_id']] = playlist['start_time']
 
 
-def add_a_missing_playlist(kfjc_playlist_id: int):
-    """Add a dummy playlist row to avoid import conflicts."""
-    row = [kfjc_playlist_id, 1, None, None, None]
-    create_playlists(row=row)
-    db.session.commit()
+def missing_playlist_row(kfjc_playlist_id: int) -> List[Any]:
+    """A dummy playlist.csv row for a kfjc_playlist_id that isn't in the
+    station data."""
+    return [kfjc_playlist_id, 1, None, None, None]
 
 
 def fix_self_titled_items(
@@ -335,15 +440,14 @@ def fix_self_titled_items(
     >>> fix_self_titled_items('Prince', " s/t ", None)
     ('Prince', 'Prince', 'Prince')
     """
-    regex_test = r"(^|\s)(S|s)\/(T|t)\b"
     if artist:
-        if bool(re.match(regex_test, artist)):
+        if SELF_TITLED_REGEX.match(artist):
             artist = None
     if album_title:
-        if bool(re.match(regex_test, album_title)):
+        if SELF_TITLED_REGEX.match(album_title):
             album_title = None
     if track_title:
-        if bool(re.match(regex_test, track_title)):
+        if SELF_TITLED_REGEX.match(track_title):
             track_title = None
 
     if not track_title:
@@ -370,12 +474,14 @@ def fix_self_titled_items(
     return album_title, artist, track_title
 
 
-def create_playlist_tracks(row: List[Any]):
-    """Add all playlist_tracks rows.
+def clean_playlist_track_row(row: List[Any]) -> Optional[Dict[str, Any]]:
+    """Clean one playlist_track.csv row into playlist_tracks column values.
+
+    time_played is borrowed from the playlist by whoever writes the row.
 
     Don't import blank rows:
-    >>> create_playlist_tracks([24506,57,"0","","","",0,'NULL','NULL'])
-    >>> create_playlist_tracks([24858,36,"0",'NULL','NULL',"",0,'NULL','NULL'])
+    >>> clean_playlist_track_row([24506,57,"0","","","",0,'NULL','NULL'])
+    >>> clean_playlist_track_row([24858,36,"0",'NULL','NULL',"",0,'NULL','NULL'])
     """
     try:
         artist = coerce_imported_data(row[3])
@@ -414,55 +520,40 @@ def create_playlist_tracks(row: List[Any]):
 
     album_title, artist, track_title = fix_self_titled_items(album_title, artist, track_title)
 
-    kfjc_playlist_id = coerce_imported_data(row[0])
-    indx = coerce_imported_data(row[1])
-    kfjc_album_id = coerce_imported_data(row[6])
+    return {
+        'kfjc_playlist_id': coerce_imported_data(row[0]),
+        'indx': coerce_imported_data(row[1]),
+        'kfjc_album_id': coerce_imported_data(row[6]),
+        'album_title': str(album_title),
+        'artist': str(artist),
+        'track_title': str(track_title)}
+
+
+def create_playlist_tracks(row: List[Any]):
+    """Add all playlist_tracks rows.
+
+    Don't import blank rows:
+    >>> create_playlist_tracks([24506,57,"0","","","",0,'NULL','NULL'])
+    >>> create_playlist_tracks([24858,36,"0",'NULL','NULL',"",0,'NULL','NULL'])
+    """
+    playlist_track = clean_playlist_track_row(row=row)
+    if not playlist_track:
+        return
+
     """Consider this: performance will be improved if we just use
     the playlist start_time for all question-making. More granularity
     than one day is not needed and this is a 3-hour window.
     """
-    try:
-        time_played = playlists.get_playlist_by_id(
-            kfjc_playlist_id=kfjc_playlist_id).start_time
-    except AttributeError:  # Some start_times are still blank.
-        time_played = None
+    # Some start_times are still blank:
+    time_played = import_cache.playlist_start_times.get(
+        playlist_track['kfjc_playlist_id'])
 
     playlist_tracks.create_playlist_track(
-        kfjc_playlist_id=kfjc_playlist_id,
-        indx=indx,
-        kfjc_album_id=kfjc_album_id,
-        album_title=str(album_title),
-        artist=str(artist),
-        track_title=str(track_title),
-        time_played=time_played)
+        **playlist_track, time_played=time_played)
 
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
 
-        # Fix rows that cause import trouble:
-        if not albums.get_album_by_id(kfjc_album_id=kfjc_album_id):
-            add_a_missing_album(
-                kfjc_album_id=kfjc_album_id, artist=artist,
-                album_title=album_title)
-        if not playlists.get_playlist_by_id(kfjc_playlist_id=kfjc_playlist_id):
-            add_a_missing_playlist(kfjc_playlist_id=kfjc_playlist_id)
-
-        # And try again; it should go through now:
-        playlist_tracks.create_playlist_track(
-            kfjc_playlist_id=kfjc_playlist_id,
-            indx=indx,
-            kfjc_album_id=kfjc_album_id,
-            album_title=album_title,
-            artist=artist,
-            track_title=track_title,
-            time_played=time_played)
-        db.session.commit()
-
-
-def create_collection_tracks(row: List[Any]):
-    """Add all collection tracks rows."""
+def clean_collection_track_row(row: List[Any]) -> Optional[Dict[str, Any]]:
+    """Clean one coll_track.csv row into tracks column values."""
 
     try:
         kfjc_album_id = coerce_imported_data(row[0])
@@ -492,58 +583,294 @@ def create_collection_tracks(row: List[Any]):
     >>> 
     """
 
-    tracks.create_track(
-        kfjc_album_id=kfjc_album_id,
-        artist=artist,
-        title=title,
-        indx=indx)
+    return {
+        'kfjc_album_id': kfjc_album_id,
+        'artist': artist,
+        'title': title,
+        'indx': indx}
 
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-
-        # Fix rows that cause import trouble:
-        add_a_missing_album(
-            kfjc_album_id=kfjc_album_id, artist=artist,
-            album_title=title)
-
-        # And try again; it should go through now:
-        tracks.create_track(
-            kfjc_album_id=kfjc_album_id,
-            artist=artist,
-            title=title,
-            indx=indx)
-        db.session.commit()
+
+def create_collection_tracks(row: List[Any]):
+    """Add all collection tracks rows."""
+
+    track = clean_collection_track_row(row=row)
+    if not track:
+        return
+
+    tracks.create_track(**track)
+
+
+def clean_track_row(row: List[Any]) -> Dict[str, Any]:
+    """Clean one track.csv row into tracks column values.
+
+    track.csv has no artist; it is borrowed from the album by whoever
+    writes the row."""
+
+    return {
+        'kfjc_album_id': coerce_imported_data(row[0]),
+        'title': str(coerce_imported_data(row[1])),
+        'indx': coerce_imported_data(row[3])}
 
 
 def create_tracks(row: List[Any]):
     """Add all tracks rows without Artist."""
 
-    kfjc_album_id = coerce_imported_data(row[0])
-    title = str(coerce_imported_data(row[1]))
-    indx = coerce_imported_data(row[3])
+    track = clean_track_row(row=row)
+    # If we can't get it from the album,
+    # this table can't tell you the artist.
+    artist = import_cache.album_artists.get(track['kfjc_album_id'])
 
-    album = albums.get_album_by_id(kfjc_album_id=kfjc_album_id)
-    if album:
-        artist = album.artist
-    else:
-        # Fix rows that cause import trouble:
-        # If we can't get it from the album,
-        # this table can't tell you the artist.
-        artist = None
-        add_a_missing_album(
-            kfjc_album_id=kfjc_album_id, artist=artist,
-            album_title=title)
-        # track_title isn't the album_title but, it's a best guess.
+    tracks.create_track(**track, artist=artist)
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- Find Missing Parents Up Front -=-=-=-=-=-=-=-=-=-=-=-
+
+
+class PlaylistTrackParents(NamedTuple):
+    """The albums and playlists one chunk of playlist_track.csv points at."""
+    album_names: Dict[int, Tuple[str, str]]  # -> (artist, album_title)
+    playlist_ids: set
+
+
+def playlist_track_parents(
+        lines: List[str], known_album_ids: set = frozenset(),
+        known_playlist_ids: set = frozenset()) -> PlaylistTrackParents:
+    """Parse a chunk of playlist_track.csv and collect the album and
+    playlist ids its imported rows point at. Each album is named by the
+    first row that points at it.
+
+    Only rows with a new id get cleaned. The pool workers don't get the
+    known ids (they would be pickled with every chunk); they clean the
+    first row for each id in their chunk instead.
+
+    >>> parents = playlist_track_parents([
+    ...     '24506,1,0,Delixx,Zion Train Dub,Uprising in Dub,7',
+    ...     '24506,2,0,"","","",8',
+    ...     '24507,1,0,Delixx,Dub,Uprising in Dub,7'])
+    >>> parents.album_names
+    {7: ('Delixx', 'Uprising in Dub')}
+    >>> sorted(parents.playlist_ids)
+    [24506, 24507]
+    """
+    album_names = {}
+    playlist_ids = set()
+    for row in csv.reader(lines):
+        try:
+            kfjc_playlist_id = coerce_imported_data(row[0])
+            kfjc_album_id = coerce_imported_data(row[6])
+        except IndexError:
+            continue  # clean_playlist_track_row won't import it either.
+        if (kfjc_playlist_id in known_playlist_ids or
+                kfjc_playlist_id in playlist_ids) and (
+                kfjc_album_id in known_album_ids or
+                kfjc_album_id in album_names):
+            continue
+        playlist_track = clean_playlist_track_row(row=row)
+        if not playlist_track:
+            continue
+        album_names.setdefault(playlist_track['kfjc_album_id'], (
+            playlist_track['artist'], playlist_track['album_title']))
+        playlist_ids.add(playlist_track['kfjc_playlist_id'])
+    return PlaylistTrackParents(
+        album_names=album_names, playlist_ids=playlist_ids)
+
+
+def find_missing_parents(
+        cache: ImportCache, executor: Optional[Executor] = None,
+        max_in_flight: int = 1) -> Dict[str, List[List[Any]]]:
+    """Scan the csv files for dj, album and playlist ids that rows point
+    at but that nobody is going to import.
+
+    Returns dummy user.csv, album.csv and playlist.csv rows for them so
+    they can all go in as one batch before the main load; no row has to
+    fail a foreign key, roll back and retry.
+    Run it once the djs are in: cache must already know them. Chunks
+    that are already loaded have nothing missing and are not read.
+    With an executor, the pool scans playlist_track.csv.
+    """
+    known_album_ids = set(cache.album_artists) | read_first_column(
+        file_path=ALBUM_DATA_PATH, cache=cache)
+    known_playlist_ids = set(cache.playlist_start_times) | read_first_column(
+        file_path=PLAYLIST_DATA_PATH, cache=cache)
+    # kfjc id -> dummy row. The first row that points at it names it:
+    missing = {'djs': {}, 'albums': {}, 'playlists': {}}
+
+    def need_a_dj(dj_id: int, air_name: Optional[str]):
+        if dj_id is not None and dj_id not in cache.dj_ids:
+            missing['djs'].setdefault(dj_id, missing_dj_row(
+                dj_id=dj_id, air_name=air_name))
+
+    def need_an_album(
+            kfjc_album_id: int, artist: Optional[str], album_title: str):
+        if kfjc_album_id is not None and kfjc_album_id not in known_album_ids:
+            missing['albums'].setdefault(kfjc_album_id, missing_album_row(
+                kfjc_album_id=kfjc_album_id, artist=artist,
+                album_title=album_title))
+
+    # Only clean the rows whose raw ids look like trouble:
+    for row in read_csv_rows(file_path=PLAYLIST_DATA_PATH, cache=cache):
+        if coerce_imported_data(row[1]) not in cache.dj_ids:
+            playlist = clean_playlist_row(row=row)
+            need_a_dj(dj_id=playlist['dj_id'], air_name=playlist['air_name'])
+
+    scan_chunk = playlist_track_parents
+    if executor is None:
+        scan_chunk = functools.partial(
+            playlist_track_parents, known_album_ids=known_album_ids,
+            known_playlist_ids=known_playlist_ids)
+    chunks = read_changed_chunks(
+        file_path=PLAYLIST_TRACK_DATA_PATH, cache=cache)
+    for _, parents in map_chunks(
+            function=scan_chunk, chunks=chunks, executor=executor,
+            max_in_flight=max_in_flight):
+        for kfjc_album_id in parents.album_names.keys() - known_album_ids:
+            artist, album_title = parents.album_names[kfjc_album_id]
+            need_an_album(
+                kfjc_album_id=kfjc_album_id, artist=artist,
+                album_title=album_title)
+        for kfjc_playlist_id in parents.playlist_ids - known_playlist_ids:
+            if kfjc_playlist_id is not None:
+                missing['playlists'].setdefault(
+                    kfjc_playlist_id, missing_playlist_row(
+                        kfjc_playlist_id=kfjc_playlist_id))
+
+    for row in read_csv_rows(file_path=COLLECTION_TRACK_DATA_PATH, cache=cache):
+        if row and coerce_imported_data(row[0]) not in known_album_ids:
+            track = clean_collection_track_row(row=row)
+            if track:
+                need_an_album(
+                    kfjc_album_id=track['kfjc_album_id'],
+                    artist=track['artist'], album_title=track['title'])
+
+    for row in read_csv_rows(file_path=TRACK_DATA_PATH, cache=cache):
+        if row and coerce_imported_data(row[0]) not in known_album_ids:
+            track = clean_track_row(row=row)
+            # track_title isn't the album_title but, it's a best guess.
+            need_an_album(
+                kfjc_album_id=track['kfjc_album_id'], artist=None,
+                album_title=track['title'])
+
+    if missing['playlists']:
+        # Dummy playlists belong to dj_id 1:
+        dummy_dj_id = missing_playlist_row(kfjc_playlist_id=None)[1]
+        need_a_dj(dj_id=dummy_dj_id, air_name=None)
+
+    return {
+        table_name: list(dummy_rows.values())
+        for table_name, dummy_rows in missing.items()}
+
+
+def add_missing_parents(missing_parents: Dict[str, List[List[Any]]]):
+    """Add every dummy parent row in one transaction."""
+
+    for row in missing_parents['djs']:
+        create_djs(row=row)
+    for row in missing_parents['albums']:
+        create_albums(row=row)
+    for row in missing_parents['playlists']:
+        create_playlists(row=row)
+    db.session.commit()
+
+
+def read_first_column(
+        file_path: str, cache: Optional[ImportCache] = None) -> set:
+    """All the ids in the first column of a csv file.
+
+    With a cache, only the chunks that aren't loaded yet are read."""
+    return {
+        coerce_imported_data(row[0])
+        for row in read_csv_rows(file_path=file_path, cache=cache) if row}
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- Weekly Delta Import -=-=-=-=-=-=-=-=-=-=-=-
+
+
+class HighWaterMarks(NamedTuple):
+    """How far the station data in the database goes. None: load it all.
+
+    Shows before kfjc_playlist_id and tracks of albums before
+    track_album_id are not read again, even if they were edited."""
+    kfjc_playlist_id: Optional[int]  # Shows from this one on get reloaded.
+    track_album_id: Optional[int]  # Tracks from this album on get reloaded.
+    new_album_ids: Optional[set]  # Albums we don't have yet.
+
+
+def get_high_water_marks() -> HighWaterMarks:
+    """Find the newest show and album-with-tracks we already have, and the
+    albums we don't.
+
+    Only ids the csv files define count: a dummy parent with a strange id
+    must not hide a week of new rows.
+    """
+    playlist_ids = read_first_column(file_path=PLAYLIST_DATA_PATH)
+    album_ids = read_first_column(file_path=ALBUM_DATA_PATH)
+    loaded_playlist_ids = {
+        kfjc_playlist_id for kfjc_playlist_id,
+        in db.session.query(Playlist.kfjc_playlist_id)}
+    loaded_album_ids = {
+        kfjc_album_id for kfjc_album_id,
+        in db.session.query(Album.kfjc_album_id)}
+    track_album_ids = {
+        kfjc_album_id for kfjc_album_id,
+        in db.session.query(Track.kfjc_album_id).distinct()}
+
+    return HighWaterMarks(
+        kfjc_playlist_id=max(
+            loaded_playlist_ids & playlist_ids, default=None),
+        track_album_id=max(track_album_ids & album_ids, default=None),
+        new_album_ids=album_ids - loaded_album_ids)
+
+
+def forget_rows_from(marks: HighWaterMarks):
+    """The last show and the last album with tracks may have been half
+    done at the last data drop. Delete them so they load again in full."""
+
+    if marks.kfjc_playlist_id is not None:
+        PlaylistTrack.query.filter(
+            PlaylistTrack.kfjc_playlist_id >= marks.kfjc_playlist_id).delete(
+            synchronize_session=False)
+        Playlist.query.filter(
+            Playlist.kfjc_playlist_id >= marks.kfjc_playlist_id).delete(
+            synchronize_session=False)
+    if marks.track_album_id is not None:
+        Track.query.filter(
+            Track.kfjc_album_id >= marks.track_album_id).delete(
+            synchronize_session=False)
+    # The chunks those rows came from have to be read again:
+    for file_path, mark in [
+            (PLAYLIST_DATA_PATH, marks.kfjc_playlist_id),
+            (PLAYLIST_TRACK_DATA_PATH, marks.kfjc_playlist_id),
+            (COLLECTION_TRACK_DATA_PATH, marks.track_album_id),
+            (TRACK_DATA_PATH, marks.track_album_id)]:
+        if mark is not None:
+            ImportedChunk.query.filter(
+                ImportedChunk.file_name == os.path.basename(file_path),
+                ImportedChunk.max_id >= mark).delete(
+                synchronize_session=False)
+    db.session.commit()
+
+
+def merge_djs(cache: ImportCache):
+    """Add new djs and update the ones we have; air names and the
+    silent_mic flag change from week to week. user.csv is small."""
+
+    for row in read_csv_rows(file_path=DJ_DATA_PATH):
+        dj = db.session.merge(Dj(**clean_dj_row(row=row)))
+        cache.dj_ids.add(dj.dj_id)
+    db.session.commit()
 
-    tracks.create_track(
-        kfjc_album_id=kfjc_album_id,
-        artist=artist,
-        title=title,
-        indx=indx)
 
-    # We have handled the error upfront.
+def merge_albums(cache: ImportCache):
+    """Update the albums we have from the chunks of album.csv that changed
+    since they were loaded; an artist or a title gets fixed now and then.
+    The albums we don't have are left for the import to add."""
+
+    for row in read_csv_rows(file_path=ALBUM_DATA_PATH, cache=cache):
+        album = clean_album_row(row=row)
+        if album['kfjc_album_id'] in cache.album_artists:
+            db.session.merge(Album(**album))
+            cache.album_artists[album['kfjc_album_id']] = album['artist']
+    db.session.commit()
 
 
 # -=-=-=-=-=-=-=-=-=-=-=- Chunk Large Files for Import -=-=-=-=-=-=-=-=-=-=-=-
@@ -552,13 +879,27 @@ def create_tracks(row: List[Any]):
 CHUNK_SIZE = 100000  # lines
 
 
-def import_all_tables():
-    """Import Station Data from csv files in chunks."""
+class CsvChunk(NamedTuple):
+    """About CHUNK_SIZE raw lines of a csv file, never cut mid-row."""
+    file_name: str
+    number: int  # Counts from 1.
+    content_hash: str
+    lines: List[str]
+    end_offset: int  # Where the next chunk starts.
+
+    def rows(self) -> List[List[str]]:
+        return list(csv.reader(self.lines))
+
+
+def import_all_tables(resume: bool = False):
+    """Import Station Data from csv files in chunks.
+
+    resume=True picks each file up after its last committed chunk.
+    """
 
     # Albums and Playlists must be imported first since
     # the other tables depend on them:
     data_path_and_function = [
-        (DJ_DATA_PATH, create_djs),
         (ALBUM_DATA_PATH, create_albums),
         (PLAYLIST_DATA_PATH, create_playlists),
         (PLAYLIST_TRACK_DATA_PATH, create_playlist_tracks),
@@ -566,7 +907,11 @@ def import_all_tables():
         (TRACK_DATA_PATH, create_tracks)]
 
     tic = time.perf_counter()
-    # Importing takes hours, but it will handle all it's own errors.
+    begin_import(cache=import_cache, resume=resume)
+    seed_a_large_csv(file_path=DJ_DATA_PATH, row_handler=create_djs)
+    # Every parent the other tables point at will exist before they load:
+    add_missing_parents(
+        missing_parents=find_missing_parents(cache=import_cache))
     for each_tuple in data_path_and_function:
         file_path, row_handler = each_tuple  # unpack
         seed_a_large_csv(file_path=file_path, row_handler=row_handler)
@@ -576,42 +921,178 @@ def import_all_tables():
 
 
 def seed_a_large_csv(file_path: str, row_handler: Callable):
-    """Large files must be broken into chunks."""
-
-    num_loops = get_num_loops(file_path=file_path)
+    """Large files must be broken into chunks.
 
-    for i in range(num_loops):
-        print(f"\n\nNow attempting {file_path}, Loop {i + 1} of {num_loops}:")
-        start_mark, end_mark = get_start_chunk_and_end_chunk_row_indexes(
-            loop_number=i)
+    Chunks whose bytes were loaded before are skipped."""
 
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
+    for chunk in read_changed_chunks(file_path=file_path, cache=import_cache):
+        print(f"\n\nNow attempting {file_path}, Chunk {chunk.number}:")
 
-            for row in itertools.islice(reader, start_mark, end_mark):
-                # This points to each table's import function:
-                row_handler(row)
+        rows = chunk.rows()
+        for row in rows:
+            # This points to each table's import function:
+            row_handler(row)
 
+        record_chunk(
+            chunk=chunk, row_count=len(rows), max_id=max_kfjc_id(rows=rows),
+            cache=import_cache, file_path=file_path)
         db.session.commit()  # Commit after each large chunk.
 
 
-def get_num_loops(file_path: str) -> int:
-    """Get the number of loops it will take to import a CSV
-    file for a given CHUNK_SIZE."""
-
-    num_lines = sum(1 for _ in open(file_path))
-    num_loops = int(num_lines / CHUNK_SIZE) + 1
-    print(f"It will take {num_loops} loops in {CHUNK_SIZE:,} line chunks.")
-    return num_loops
+def read_raw_chunks(
+        file_path: str, start: Optional[Checkpoint] = None
+) -> Iterator[CsvChunk]:
+    """Walk a CSV file exactly once, CHUNK_SIZE lines at a time.
 
+    The header row is skipped; with a start, everything up to its
+    byte_offset is. A quoted cell can hold line breaks, so a chunk only
+    ends where the quotes are balanced.
+    """
 
-def get_start_chunk_and_end_chunk_row_indexes(loop_number: int) -> tuple:
-    """Identify the start and end rows for a data chunk to be imported."""
+    file_name = os.path.basename(file_path)
+    with open(file_path, 'r') as file:
+        number = 0
+        if start:
+            file.seek(start.byte_offset)
+            number = start.chunk_number
+        else:
+            file.readline()  # Skip the header row.
+
+        lines = []
+        in_quotes = False
+        # readline, not "for line in file", keeps file.tell() working:
+        for line in iter(file.readline, ''):
+            lines.append(line)
+            if line.count('"') % 2:
+                in_quotes = not in_quotes
+            if len(lines) >= CHUNK_SIZE and not in_quotes:
+                number += 1
+                yield make_chunk(
+                    file_name=file_name, number=number, lines=lines,
+                    end_offset=file.tell())
+                lines = []
+        if lines:
+            yield make_chunk(
+                file_name=file_name, number=number + 1, lines=lines,
+                end_offset=file.tell())
+
+
+def make_chunk(
+        file_name: str, number: int, lines: List[str],
+        end_offset: int) -> CsvChunk:
+    return CsvChunk(
+        file_name=file_name, number=number,
+        content_hash=hashlib.sha256("".join(lines).encode()).hexdigest(),
+        lines=lines, end_offset=end_offset)
+
+
+def read_changed_chunks(
+        file_path: str, cache: ImportCache) -> Iterator[CsvChunk]:
+    """Only the chunks of a CSV file that aren't loaded byte for byte,
+    starting after the file's checkpoint if there is one.
+
+    Outside a delta import, a chunk that was loaded with other bytes
+    raises ValueError: its old rows are still in, and loading it again
+    would double them up or collide with them."""
+
+    start = cache.resume_point(file_path=file_path)
+    if start:
+        print(
+            f"\n\nResuming {file_path} after chunk {start.chunk_number} "
+            f"({start.row_count} rows).")
+    for chunk in read_raw_chunks(file_path=file_path, start=start):
+        if cache.has_chunk(chunk=chunk):
+            continue
+        if cache.had_chunk(chunk=chunk) and not cache.delta:
+            raise ValueError(
+                f"{chunk.file_name} chunk {chunk.number} changed since it "
+                f"was loaded. Load new station data with weekly_update(), "
+                f"or start over with nuclear_option().")
+        yield chunk
+
+
+def map_chunks(
+        function: Callable, chunks: Iterator[CsvChunk],
+        executor: Optional[Executor] = None, max_in_flight: int = 1
+) -> Iterator[Tuple[CsvChunk, Any]]:
+    """Yield each chunk with function(chunk.lines), in file order.
+
+    Without an executor the work happens right here. With one, up to
+    max_in_flight chunks are being worked on by the pool while the
+    caller handles the chunk that is ready. Only the raw lines are
+    pickled, so function has to be a module-level function (or a
+    functools.partial of one).
+    """
 
-    if loop_number == 0:
-        return 1, CHUNK_SIZE
+    pending = deque()
+    for chunk in chunks:
+        if executor is None:
+            yield chunk, function(chunk.lines)
+            continue
+        pending.append((chunk, executor.submit(function, chunk.lines)))
+        if len(pending) >= max_in_flight:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    while pending:
+        chunk, future = pending.popleft()
+        yield chunk, future.result()
+
+
+def max_kfjc_id(rows: List[List[str]]) -> Optional[int]:
+    """The largest id in the first column of some csv rows.
+
+    >>> max_kfjc_id([['7', 'Album'], [], ['NULL'], ['12', 'Album']])
+    12
+    >>> max_kfjc_id([['NULL']])
+    """
+    ids = [
+        kfjc_id for kfjc_id in (
+            coerce_imported_data(row[0]) for row in rows if row)
+        if isinstance(kfjc_id, int)]
+    return max(ids, default=None)
+
+
+def record_chunk(
+        chunk: CsvChunk, row_count: int, max_id: Optional[int],
+        cache: ImportCache, file_path: str):
+    """Note a chunk as loaded and move the file's checkpoint past it.
+    Both commit along with the chunk's rows."""
+
+    db.session.merge(ImportedChunk(
+        file_name=chunk.file_name, chunk_number=chunk.number,
+        content_hash=chunk.content_hash, max_id=max_id))
+    cache.chunk_hashes[(chunk.file_name, chunk.number)] = chunk.content_hash
+
+    previous = cache.checkpoints.get(chunk.file_name)
+    if previous and previous.chunk_number < chunk.number:
+        row_count += previous.row_count
+    checkpoint = Checkpoint(
+        chunk_number=chunk.number, byte_offset=chunk.end_offset,
+        row_count=row_count,
+        file_signature=file_signature(file_path=file_path))
+    db.session.merge(ImportCheckpoint(
+        file_name=chunk.file_name, **checkpoint._asdict()))
+    cache.checkpoints[chunk.file_name] = checkpoint
+
+
+def file_signature(file_path: str) -> str:
+    """Size and modified time: enough to tell this week's file from last's."""
+    stat = os.stat(file_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def read_csv_rows(
+        file_path: str, cache: Optional[ImportCache] = None
+) -> Iterator[List[str]]:
+    """Walk a CSV file one row at a time, header skipped.
+
+    With a cache, only the chunks that aren't loaded yet are read."""
+    if cache is not None:
+        chunks = read_changed_chunks(file_path=file_path, cache=cache)
     else:
-        return loop_number * CHUNK_SIZE, (loop_number + 1) * CHUNK_SIZE
+        chunks = read_raw_chunks(file_path=file_path)
+    for chunk in chunks:
+        yield from chunk.rows()
 
 
 if __name__ == "__main__":
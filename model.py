@@ -58,6 +58,9 @@ class Answer(db.Model):
     """A response from a user."""
 
     __tablename__ = 'answers'
+    __table_args__ = (
+        # get_unique_question asks "has this user answered this question?"
+        db.Index('ix_answers_user_id_question_id', 'user_id', 'question_id'),)
 
     answer_id = db.Column(
         db.Integer, autoincrement=True, primary_key=True, nullable=False)
@@ -82,6 +85,23 @@ class Answer(db.Model):
             f"{self.answer_correct}\t{self.timestamp}")
 
 
+class UserScore(db.Model):
+    """Running answer tallies for a user, kept by answers.create_answer."""
+
+    __tablename__ = 'user_scores'
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.user_id"), primary_key=True)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (
+            f"\nU:{self.user_id}\tP:{self.passed}\t"
+            f"F:{self.failed}\tS:{self.skipped}")
+
+
 class Dj(db.Model):
     """A DJ from the station."""
 
@@ -191,6 +211,97 @@ class Track(db.Model):
             f"Album {self.kfjc_album_id}, Track {self.indx}: {self.title}")
 
 
+class ImportedChunk(db.Model):
+    """A chunk of a station csv file that has been loaded."""
+
+    __tablename__ = 'imported_chunks'
+
+    file_name = db.Column(db.String(60), primary_key=True)
+    chunk_number = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    max_id = db.Column(db.Integer, nullable=True)  # Largest id in column 0.
+
+    def __repr__(self):
+        return (
+            f"\n{self.file_name} chunk {self.chunk_number}: "
+            f"{self.content_hash}")
+
+
+class ImportCheckpoint(db.Model):
+    """How far the import has committed into a station csv file."""
+
+    __tablename__ = 'import_checkpoints'
+
+    file_name = db.Column(db.String(60), primary_key=True)
+    chunk_number = db.Column(db.Integer, nullable=False)
+    byte_offset = db.Column(db.BigInteger, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    file_signature = db.Column(db.String(60), nullable=False)  # size:mtime
+
+    def __repr__(self):
+        return (
+            f"\n{self.file_name}: {self.row_count} rows, "
+            f"chunk {self.chunk_number}, byte {self.byte_offset}")
+
+
+class LibraryPick(db.Model):
+    """An artist, album or track eligible for random questions.
+
+    Numbered 1, 2, 3... within a category, most played first, so the
+    items played more than N times are always pick_numbers 1 to some n.
+    """
+
+    __tablename__ = 'library_picks'
+    __table_args__ = (
+        db.Index(
+            'ix_library_picks_category_appearances',
+            'category', 'appearances'),)
+
+    category = db.Column(db.String(20), primary_key=True)
+    pick_number = db.Column(db.Integer, primary_key=True)
+    item = db.Column(db.String, nullable=False)
+    appearances = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"\n{self.category} {self.pick_number}: {self.item} "
+            f"({self.appearances})")
+
+
+class WeeklyPlay(db.Model):
+    """Plays of one track in one week, counted at the end of each import.
+
+    Only weeks that are over are counted; the Top Plays add up the weeks
+    inside a date range and count the days on either side one by one.
+    """
+
+    __tablename__ = 'weekly_plays'
+
+    id_ = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    week = db.Column(db.Date, nullable=False, index=True)  # A Monday.
+    artist = db.Column(db.String(100))
+    album_title = db.Column(db.String(100))
+    track_title = db.Column(db.String(100))
+    plays = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"\nWeek of {self.week}: {self.track_title} from "
+            f"{self.album_title} by {self.artist} ({self.plays})")
+
+
+class StationStat(db.Model):
+    """A homepage stat, counted at the end of each import."""
+
+    __tablename__ = 'station_stats'
+
+    name = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.String, nullable=True)  # int or isoformat date
+
+    def __repr__(self):
+        return f"\n{self.name}: {self.value}"
+
+
 def connect_to_db(flask_app, db_uri=f"postgresql:///{DATABASE}", echo=True):
     flask_app.config["SQLALCHEMY_DATABASE_URI"] = db_uri
     flask_app.config["SQLALCHEMY_ECHO"] = echo
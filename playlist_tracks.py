@@ -1,13 +1,18 @@
 """Playlist Track operations for KFJC Trivia Robot."""
 
+from datetime import datetime, date, timedelta
 from sqlalchemy import text, func, exc
-from typing import NamedTuple, Union
+from typing import (
+    NamedTuple, Union, List, Dict, Tuple, Any, Optional, Iterable, Iterator)
 
 from model import db, connect_to_db, PlaylistTrack
 import djs
+import search_index
 import common
 
 LIMITER = 500  # Make sure this agrees with listeners.js.
+SAMPLE_OVERDRAW = 3  # Random pick_numbers drawn per item wanted.
+STREAM_CHUNK_ROWS = 100  # Rows fetched at a time when streaming.
 
 
 def create_playlist_track(
@@ -143,7 +148,10 @@ def get_top10_tracks(
 def get_top_plays(
         start_date: str, end_date: str, sql_variable: str,
         group_by: str, n: int = 10) -> NamedTuple:
-    """Get the top plays between any two dates.***"""
+    """Get the top plays between any two dates.***
+
+    Whole weeks come out of weekly_plays; only the odd days at either
+    end are counted from playlist_tracks."""
 
     if start_date > end_date:  # Just flip 'em
         old_start_date = start_date
@@ -151,14 +159,30 @@ def get_top_plays(
         end_date = old_start_date
         start_date = old_end_date
 
-    top_n = text(
-        f""" SELECT count({sql_variable}) as plays, {group_by}
+    plays_in_range = f"""SELECT 1 AS plays, artist, album_title, track_title
         FROM playlist_tracks
         WHERE time_played >= date('{start_date}')
-        AND time_played <= date('{end_date}')
-        AND {sql_variable} != 'None'
+        AND time_played <= date('{end_date}')"""
+    weeks = rolled_up_weeks(start_date=start_date, end_date=end_date)
+    if weeks:
+        first_week, after_last_week = weeks
+        plays_in_range = f"""SELECT plays, artist, album_title, track_title
+        FROM weekly_plays
+        WHERE week >= date('{first_week}') AND week < date('{after_last_week}')
+        UNION ALL
+        SELECT 1 AS plays, artist, album_title, track_title
+        FROM playlist_tracks
+        WHERE (time_played >= date('{start_date}')
+        AND time_played < date('{first_week}'))
+        OR (time_played >= date('{after_last_week}')
+        AND time_played <= date('{end_date}'))"""
+
+    top_n = text(
+        f""" SELECT SUM(plays) as plays, {group_by}
+        FROM ({plays_in_range}) AS plays_in_range
+        WHERE {sql_variable} != 'None'
         GROUP BY {group_by}
-        ORDER BY count({sql_variable}) DESC
+        ORDER BY SUM(plays) DESC, {group_by}
         LIMIT {n} """)
 
     reply = db.session.execute(top_n)
@@ -167,6 +191,67 @@ def get_top_plays(
     return reply_named_tuple
 
 
+def rolled_up_weeks(
+        start_date: Union[str, date], end_date: Union[str, date]
+) -> Optional[Tuple[date, date]]:
+    """The first Monday and the Monday after the last week that
+    weekly_plays can answer for; None to count it all by hand."""
+
+    try:
+        start_date = date.fromisoformat(str(start_date))
+        end_date = date.fromisoformat(str(end_date))
+    except ValueError:  # Some other date format Postgres understands.
+        return None
+    first_week, last_week = db.session.execute(
+        "SELECT MIN(week), MAX(week) FROM weekly_plays;").first()
+    if first_week is None:  # No refresh_weekly_plays yet.
+        return None
+    return whole_weeks_between(
+        start_date=start_date, end_date=end_date,
+        first_week=first_week, last_week=last_week)
+
+
+def whole_weeks_between(
+        start_date: date, end_date: date, first_week: date, last_week: date
+) -> Optional[Tuple[date, date]]:
+    """Monday to Monday, the weeks from first_week to last_week that lie
+    between the dates.
+
+    >>> whole_weeks_between(
+    ...     date(2019, 10, 2), date(2019, 11, 27),
+    ...     first_week=date(2011, 1, 3), last_week=date(2019, 11, 11))
+    (datetime.date(2019, 10, 7), datetime.date(2019, 11, 18))
+    >>> whole_weeks_between(
+    ...     date(2019, 10, 2), date(2019, 10, 9),
+    ...     first_week=date(2011, 1, 3), last_week=date(2019, 11, 11))
+    """
+    first_monday = start_date + timedelta(days=-start_date.weekday() % 7)
+    last_monday = end_date - timedelta(days=end_date.weekday())
+    first_monday = max(first_monday, first_week)
+    last_monday = min(last_monday, last_week + timedelta(days=7))
+    if first_monday >= last_monday:
+        return None
+    return first_monday, last_monday
+
+
+def refresh_weekly_plays():
+    """Count the plays of every track in every week that's over.
+    Run at the end of every import."""
+
+    db.session.execute("DELETE FROM weekly_plays;")
+    db.session.execute(
+        """INSERT INTO weekly_plays
+        (week, artist, album_title, track_title, plays)
+        SELECT DATE_TRUNC('week', time_played), artist, album_title,
+        track_title, COUNT(*)
+        FROM playlist_tracks
+        WHERE time_played < DATE_TRUNC(
+            'week', (SELECT MAX(time_played) FROM playlist_tracks))
+        GROUP BY DATE_TRUNC('week', time_played), artist, album_title,
+        track_title """)
+    db.session.commit()
+
+
 # -=-=-=-=-=-=-=- When is the last time someone played _ ? -=-=-=-=-=-=-=-
 
 
@@ -194,9 +279,120 @@ def get_a_random_track(min_appearances: int = 3) -> str:
         pick_type='track_title', min_appearances=min_appearances)
 
 
+# -=-=-=-=-=-=-=-=-=-=-=- Library Picks -=-=-=-=-=-=-=-=-=-=-=-
+
+# pick category -> (playlist_tracks column counted, column that can't be 'None')
+LIBRARY_PICK_COLUMNS = {
+    'artist': ('artist', 'artist'),
+    'album_title': ('album_title', 'album_title'),
+    'kfjc_album_id': ('kfjc_album_id', 'album_title'),
+    'track_title': ('track_title', 'track_title')}
+
+
+def library_pick_category(pick_type: str) -> str:
+    """
+    >>> library_pick_category('Album')
+    'album_title'
+    >>> library_pick_category('kfjc_album_id')
+    'kfjc_album_id'
+    >>> library_pick_category('anything else')
+    'track_title'
+    """
+    if pick_type in ['artist', 'Artist']:
+        return 'artist'
+    elif pick_type in ['album', 'Album', 'album_title']:
+        return 'album_title'
+    elif pick_type in ['kfjc_album_id']:
+        return 'kfjc_album_id'
+    else:  # Just give 'em a track, I guess.
+        return 'track_title'
+
+
+def refresh_library_picks():
+    """Count every artist, album and track in playlist_tracks once.
+    Run at the end of every import."""
+
+    db.session.execute("DELETE FROM library_picks;")
+    for category, (column, searcher) in LIBRARY_PICK_COLUMNS.items():
+        db.session.execute(
+            f"""INSERT INTO library_picks
+            (category, pick_number, item, appearances)
+            SELECT '{category}',
+            ROW_NUMBER() OVER (ORDER BY COUNT({column}) DESC, {column}),
+            CAST({column} AS VARCHAR), COUNT({column})
+            FROM playlist_tracks
+            WHERE {searcher} != 'None' AND {column} IS NOT NULL
+            GROUP BY {column} """)
+    db.session.commit()
+    search_index.refresh_typeahead()
+
+
 def random_library_pick(
         pick_type='track_title', min_appearances: int = 3) -> Union[str, int]:
     """Get one random item from the library."""
+    picks = sample_library(
+        pick_type=pick_type, k=1, min_appearances=min_appearances)
+    if picks:
+        return picks[0]
+
+
+def sample_library(
+        pick_type: str, k: int, min_appearances: int = 3,
+        exclude: Iterable[Union[str, int]] = ()) -> List[Union[str, int]]:
+    """Up to k different random items from the library, in one query.
+
+    Draws a few more random pick_numbers than needed, since they can
+    collide or land on an excluded item. Items played min_appearances
+    times or fewer, and items in exclude, never come back."""
+    category = library_pick_category(pick_type=pick_type)
+    exclude = [str(item) for item in exclude]
+    eligible = (
+        f"""category = '{category}'
+        AND appearances > {int(min_appearances)}""")
+    not_excluded = ""
+    if exclude:
+        not_excluded = f"AND item NOT IN ({sql_string_list(exclude)})"
+    draws = int(k) * SAMPLE_OVERDRAW + len(exclude)
+    picks = [pick for pick, in db.session.execute(
+        f"""SELECT item FROM library_picks
+        WHERE {eligible} {not_excluded}
+        AND pick_number IN (
+            SELECT CAST(FLOOR(RANDOM() * eligible.n) AS INTEGER) + 1
+            FROM (
+                SELECT COUNT(*) AS n FROM library_picks
+                WHERE {eligible}) eligible,
+            GENERATE_SERIES(1, {draws}))
+        ORDER BY RANDOM()
+        LIMIT {int(k)} """)]
+    if len(picks) < k:  # Few to choose from: take them all, shuffled.
+        picks = [pick for pick, in db.session.execute(
+            f"""SELECT item FROM library_picks
+            WHERE {eligible} {not_excluded}
+            ORDER BY RANDOM()
+            LIMIT {int(k)} """)]
+    if not picks:  # Nothing eligible, or no refresh_library_picks yet.
+        return sample_library_by_grouping(
+            pick_type=pick_type, k=k, min_appearances=min_appearances,
+            exclude=exclude)
+    if category == 'kfjc_album_id':
+        return [int(pick) for pick in picks]
+    return picks
+
+
+def sql_string_list(items: Iterable[str]) -> str:
+    """
+    >>> print(sql_string_list(["Spliff Skankin'", '694447']))
+    'Spliff Skankin''', '694447'
+    """
+    return ", ".join(
+        "'" + item.replace("'", "''") + "'" for item in items)
+
+
+def sample_library_by_grouping(
+        pick_type: str, k: int, min_appearances: int = 3,
+        exclude: Iterable[str] = ()) -> List[Union[str, int]]:
+    """Random items from the library the slow way: group all of
+    playlist_tracks."""
     if pick_type in ['artist', 'Artist']:
         library_category = PlaylistTrack.artist
         searcher = library_category
@@ -210,22 +406,22 @@ def random_library_pick(
         library_category = PlaylistTrack.track_title
         searcher = library_category
 
+    exclude = set(exclude)
     try:
-        return db.session.query(
+        picks = db.session.query(
             library_category).filter(
             searcher != 'None').group_by(
             library_category).having(
             func.count(
                 library_category) > min_appearances).order_by(
-            func.random()).first()[0]
+            func.random()).limit(k + len(exclude)).all()
     except exc.ProgrammingError:
         # Pick again if there's a problem.
-        return
+        return []
     except exc.InternalError:
         # Pick again if there's a problem.
-        return
-    except TypeError:  # 'NoneType' object is not subscriptable
-        return
+        return []
+    return [pick for pick, in picks if str(pick) not in exclude][:k]
 
 
 """ ***
@@ -260,9 +456,44 @@ def get_last_play_of_track(track: str, reverse: bool = False) -> NamedTuple:
 
 def last_time_played(
         search_column_name: str, search_for_item: str,
-        reverse: bool = False) -> NamedTuple:
+        reverse: bool = False, page_size: int = LIMITER,
+        after: Optional[str] = None) -> NamedTuple:
     """Search and return the last time any DJ played
-    an artist, album or track."""
+    an artist, album or track.
+
+    A page at a time: pass the last row's last_play_cursor as after to
+    get the page that follows it."""
+
+    results = db.session.execute(last_plays_query(
+        search_column_name=search_column_name,
+        search_for_item=search_for_item, reverse=reverse,
+        page_size=page_size, after=after))
+    reply_named_tuple = common.convert_list_o_dicts_to_list_o_named_tuples(
+        results)
+    return reply_named_tuple
+
+
+def stream_last_plays(
+        search_column_name: str, search_for_item: str,
+        reverse: bool = False, page_size: Optional[int] = None,
+        after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """The same search, row by row, as the database cursor hands them
+    over. No page size: every match after the cursor."""
+
+    results = db.session.execute(last_plays_query(
+        search_column_name=search_column_name,
+        search_for_item=search_for_item, reverse=reverse,
+        page_size=page_size, after=after
+    ).execution_options(stream_results=True))
+    for rows in results.mappings().partitions(STREAM_CHUNK_ROWS):
+        yield from rows
+
+
+def last_plays_query(
+        search_column_name: str, search_for_item: str, reverse: bool,
+        page_size: Optional[int], after: Optional[str]) -> text:
+    """Oldest or newest first, with id_ to break ties, so every play
+    lands on exactly one page."""
 
     # LIKE on a bare string is vulnerable to SQL Injection attack;
     # so, neuter their weapons:
@@ -271,26 +502,67 @@ def last_time_played(
         "@", " ").replace("-", " ").replace(
         "*", " ").replace("  ", " ").strip()
 
+    # The trigram index narrows it down to a few rows, if it can:
+    candidate_ids = search_index.matching_ids(
+        field=search_column_name, query=search_for_item)
+    only_candidates = ""
+    if candidate_ids is not None:
+        only_candidates = (  # IN (NULL) matches nothing.
+            f"AND pt.id_ IN "
+            f"({', '.join(map(str, candidate_ids)) or 'NULL'})")
+
     # Still, each word should participate in the search:
     search_for_item = search_for_item.replace(" ", "%")
 
     reverse_it = "DESC" if reverse else ""
-    who_played_it_when = (
+    after_cursor = ""
+    cursor_params = {}
+    if after is not None:
+        after_cursor = (
+            f"AND (pt.time_played, pt.id_) {'<' if reverse else '>'} "
+            f"(:after_time_played, :after_id)")
+        cursor_params['after_time_played'], cursor_params['after_id'] = (
+            parse_last_play_cursor(after))
+    limit = f"LIMIT {int(page_size)}" if page_size else ""
+    return text(
         f""" SELECT p.dj_id, p.air_name, pt.artist, pt.album_title,
-        pt.track_title, pt.time_played
+        pt.track_title, pt.time_played, pt.id_
         FROM playlists as p
         INNER JOIN playlist_tracks as pt
         ON (p.kfjc_playlist_id = pt.kfjc_playlist_id)
         WHERE LOWER(pt.{search_column_name}) LIKE LOWER('%{search_for_item}%')
+        {only_candidates}
         AND pt.time_played IS NOT NULL
         AND pt.{search_column_name} != 'None'
-        ORDER BY pt.time_played {reverse_it}
-        LIMIT {LIMITER}""")
+        {after_cursor}
+        ORDER BY pt.time_played {reverse_it}, pt.id_ {reverse_it}
+        {limit}""").bindparams(**cursor_params)
 
-    results = db.session.execute(who_played_it_when)
-    reply_named_tuple = common.convert_list_o_dicts_to_list_o_named_tuples(
-        results)
-    return reply_named_tuple
+
+def last_play_cursor(last_play: Union[NamedTuple, Dict[str, Any]]) -> str:
+    """Where the next page starts: a row's time_played and id_.
+
+    >>> last_play_cursor({'time_played': datetime(2019, 11, 26, 2, 1, 15),
+    ...                   'id_': 121})
+    '2019-11-26T02:01:15_121'
+    """
+    if hasattr(last_play, '_asdict'):
+        last_play = last_play._asdict()
+    return f"{last_play['time_played'].isoformat()}_{last_play['id_']}"
+
+
+def parse_last_play_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for anything last_play_cursor didn't make.
+
+    >>> parse_last_play_cursor('2019-11-26T02:01:15_121')
+    (datetime.datetime(2019, 11, 26, 2, 1, 15), 121)
+    >>> parse_last_play_cursor("2019-11-26_1; DROP TABLE users")
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid literal for int() with base 10: '1; DROP TABLE users'
+    """
+    time_played, _, id_ = cursor.rpartition('_')
+    return datetime.fromisoformat(time_played), int(id_)
 
 
 # -=-=-=-=-=-=-=- Get stats for greeting statement -=-=-=-=-=-=-=-
@@ -301,9 +573,38 @@ def how_many_tracks() -> int:
     return common.get_count(PlaylistTrack.id_)
 
 
+# -=-=-=-=-=-=-=- Indexes Built After an Import -=-=-=-=-=-=-=-
+# Not made by db.create_all: every row an import loads into an indexed
+# table would have to update the index too, undoing the COPY speedup.
+
+# last_time_played searches LOWER(column) LIKE '%words%'.
+# Only a trigram index can help with the leading wildcard:
+TRIGRAM_SEARCH_COLUMNS = ['artist', 'album_title', 'track_title']
+
+
+def create_playlist_tracks_indexes():
+    """Index the loaded rows in one pass each. Run at the end of every
+    import; indexes that are already there are left alone."""
+
+    db.session.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    for column in TRIGRAM_SEARCH_COLUMNS:
+        db.session.execute(
+            f"""CREATE INDEX IF NOT EXISTS ix_playlist_tracks_{column}_trgm
+            ON playlist_tracks USING gin (LOWER({column}) gin_trgm_ops);""")
+    # The Top Plays edges, and /last_played pages, are time_played ranges:
+    db.session.execute(
+        """CREATE INDEX IF NOT EXISTS ix_playlist_tracks_time_played
+        ON playlist_tracks (time_played);""")
+    db.session.commit()
+
+
 if __name__ == '__main__':
     """Will connect you to the database when you run
     playlist_tracks.py interactively"""
     from server import app
 
     connect_to_db(app)
+
+    import doctest
+
+    doctest.testmod()  # python3 playlist_tracks.py -v
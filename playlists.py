@@ -71,7 +71,7 @@ def get_djs_by_show_count(reverse: bool = False) -> NamedTuple:
 
 def dj_stats(order_by_column: str, reverse: bool = False) -> NamedTuple:
     """Everything there is to know about DJs: air_name,
-    dj_id, showcount, firstshow and lastshow."""
+    dj_id, silent_mic, showcount, firstshow and lastshow."""
     reverse_it = "DESC" if reverse else ""
     prolific_djs = (
         f"""SELECT dj_id
@@ -86,11 +86,12 @@ def dj_stats(order_by_column: str, reverse: bool = False) -> NamedTuple:
         GROUP by dj_id
         HAVING dj_id in ({prolific_djs}) """)
     dj_id_to_air_name = (
-        f"""SELECT dj_id, air_name
+        f"""SELECT dj_id, air_name, silent_mic
         FROM djs
         WHERE NOT administrative""")
     dj_stats = (
         f"""SELECT dj_id_to_air_name.air_name, first_last_count.dj_id,
+        dj_id_to_air_name.silent_mic,
         first_last_count.SHOWCOUNT as showcount,
         first_last_count.FIRSTSHOW as firstshow,
         first_last_count.LASTSHOW as lastshow
@@ -2,9 +2,12 @@
 
 from datetime import datetime, timedelta, date
 import time
+import threading
+from array import array
+from collections import OrderedDict
 from operator import attrgetter
-from random import randrange, choice, choices, shuffle
-from typing import List, Any, NamedTuple
+from random import randrange, randint, choice, choices, shuffle
+from typing import List, Any, NamedTuple, Optional
 
 from model import Album, db, connect_to_db, Answer, PlaylistTrack, Question
 import djs
@@ -16,6 +19,9 @@ import tracks
 import common
 
 SEED_QUESTION_COUNT = 30
+ANSWERED_CACHE_SIZE = 1000  # Users whose answers we keep in memory; 0 is off.
+QUESTION_POOL_SECONDS = 300  # How often to look for new questions.
+RANDOM_DRAWS = 8  # Blind picks before listing every unseen question.
 QUESTION_TYPES = {
     'djs': "A Question about DJs:",
     'artists': "A Question about Artists:",
@@ -54,20 +60,168 @@ def get_question_by_id(question_id: int) -> Question:
 # -=-=-=-=-=-=-=-=-=-=-=- Choose Random Question -=-=-=-=-=-=-=-=-=-=-=-
 
 
-def get_unique_question(user_id: int) -> Question:
-    """Pose a question to the user that they have not answered before."""
+class UnseenQuestionCache:
+    """Every question_id, and a bitmap per recently active user of the
+    question_ids they have answered, so drawing an unseen question needs
+    no database query. Users are evicted least recently used first.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self.question_ids = common.SharedCache(
+            load=load_question_ids, max_seconds=QUESTION_POOL_SECONDS)
+        self.answered = OrderedDict()  # user_id -> bytearray, 1 bit per id
+        self.loading = {}  # user_id -> question_ids answered mid-load
+        self.lock = threading.Lock()  # Guards answered and loading.
+
+    def draw(self, user_id: int) -> Optional[int]:
+        """A random question_id the user hasn't answered, or None."""
+        question_ids = self.question_ids.get()
+        if not question_ids:
+            return None
+        bitmap = self.bitmap_for(user_id=user_id)
+        with self.lock:  # remember() may be setting a bit.
+            for _ in range(RANDOM_DRAWS):
+                question_id = choice(question_ids)
+                if not has_bit(bitmap=bitmap, index=question_id):
+                    return question_id
+            # A heavy player; stop guessing:
+            unseen = [
+                question_id for question_id in question_ids
+                if not has_bit(bitmap=bitmap, index=question_id)]
+            if not unseen:
+                return None
+            return choice(unseen)
+
+    def bitmap_for(self, user_id: int) -> bytearray:
+        """Call without the lock held: a user who isn't cached is loaded
+        from the database, and nobody else's draw waits on that."""
+        with self.lock:
+            if user_id in self.answered:
+                self.answered.move_to_end(user_id)
+                return self.answered[user_id]
+            self.loading.setdefault(user_id, set())
+
+        try:
+            bitmap = load_answered_bitmap(user_id=user_id)
+        except Exception:
+            with self.lock:
+                self.loading.pop(user_id, None)
+            raise
+
+        with self.lock:
+            if user_id in self.answered:  # Another draw loaded them first.
+                self.answered.move_to_end(user_id)
+                return self.answered[user_id]
+            # Answers that came in while the query ran:
+            for question_id in self.loading.pop(user_id, ()):
+                bitmap = set_bit(bitmap=bitmap, index=question_id)
+            self.answered[user_id] = bitmap
+            while len(self.answered) > self.max_users:
+                self.answered.popitem(last=False)
+            return bitmap
+
+    def remember(self, user_id: int, question_id: int):
+        """A user answered; only matters if they're in the cache, or on
+        their way in."""
+        with self.lock:
+            if user_id in self.answered:
+                self.answered[user_id] = set_bit(
+                    bitmap=self.answered[user_id], index=question_id)
+            elif user_id in self.loading:
+                self.loading[user_id].add(question_id)
+
+    def clear(self):
+        self.question_ids.clear()
+        with self.lock:
+            self.answered.clear()
+            self.loading.clear()
+
+
+def load_question_ids() -> array:
+    return array('l', [
+        question_id for question_id, in db.session.query(Question.question_id)])
+
+
+def load_answered_bitmap(user_id: int) -> bytearray:
+    """A bit for every question_id the user has answered."""
+    bitmap = bytearray()
+    for question_id, in db.session.query(Answer.question_id).filter(
+            Answer.user_id == user_id):
+        if question_id is not None:
+            bitmap = set_bit(bitmap=bitmap, index=question_id)
+    return bitmap
+
+
+def set_bit(bitmap: bytearray, index: int) -> bytearray:
+    """
+    >>> set_bit(bytearray(), 9)
+    bytearray(b'\\x00\\x02')
+    """
+    byte, bit = divmod(index, 8)
+    if byte >= len(bitmap):
+        bitmap.extend(bytes(byte + 1 - len(bitmap)))
+    bitmap[byte] |= 1 << bit
+    return bitmap
+
+
+def has_bit(bitmap: bytearray, index: int) -> bool:
+    """
+    >>> has_bit(bytearray(b'\\x00\\x02'), 9)
+    True
+    >>> has_bit(bytearray(b'\\x00\\x02'), 8)
+    False
+    >>> has_bit(bytearray(b'\\x00\\x02'), 700)
+    False
+    """
+    byte, bit = divmod(index, 8)
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << bit))
+
+
+unseen_questions = UnseenQuestionCache(max_users=ANSWERED_CACHE_SIZE)
 
-    users_answers = Answer.query.filter(Answer.user_id == user_id).all()
-    user_already_answered = [
-        users_answer.question_id for users_answer in users_answers]
-    question_ids = [
-        one_question.question_id for one_question in Question.query.all()]
-    allowed_pool = list(set(question_ids) - set(user_already_answered))
-    if not allowed_pool:
-        return  # You've answered all the questions!
 
-    random_question_id = choice(allowed_pool)
-    return get_question_by_id(question_id=random_question_id)
+def get_unique_question(user_id: int) -> Question:
+    """Pose a question to the user that they have not answered before.
+
+    Drawn from unseen_questions; the database picks when the cache is off
+    or comes up empty (the question pool may be a few minutes old).
+    """
+    if unseen_questions.max_users:
+        question_id = unseen_questions.draw(user_id=user_id)
+        if question_id is not None:
+            question = get_question_by_id(question_id=question_id)
+            if question:
+                return question
+    return get_unique_question_from_db(user_id=user_id)
+
+
+def get_unique_question_from_db(user_id: int) -> Question:
+    """Pose a question to the user that they have not answered before.
+
+    Picks a random question_id and takes the first unanswered question at
+    or after it, wrapping around to the start. Both halves walk the
+    primary key, and each NOT EXISTS is one probe of the answers
+    (user_id, question_id) index, so nothing is loaded to choose.
+    (A question right after a run of answered ones is a bit likelier.)
+    """
+    lowest_id, highest_id = db.session.query(
+        db.func.min(Question.question_id),
+        db.func.max(Question.question_id)).one()
+    if lowest_id is None:
+        return  # No questions yet.
+
+    already_answered = db.session.query(Answer.answer_id).filter(
+        Answer.user_id == user_id,
+        Answer.question_id == Question.question_id).exists()
+    unanswered = Question.query.filter(~already_answered).order_by(
+        Question.question_id)
+
+    random_question_id = randint(lowest_id, highest_id)
+    return (
+        unanswered.filter(Question.question_id >= random_question_id).first()
+        or unanswered.filter(Question.question_id < random_question_id).first())
+    # None: You've answered all the questions!
 
 
 # -=-=-=-=-=-=-=-=-=-=-=- Seed Questions Table -=-=-=-=-=-=-=-=-=-=-=-
@@ -78,6 +232,7 @@ def make_all_questions():
 
     Creates 640 questions in 10 mins."""
     tic = time.perf_counter()
+    djs.dj_directory.refresh()  # The station data may be new.
     who_is_the_oldest_dj()
     who_is_the_newest_dj()
     who_has_the_most_shows()
@@ -88,6 +243,7 @@ def make_all_questions():
     artist_of_an_album()
     tracks_on_an_album()
     create_last_play_questions()
+    unseen_questions.clear()  # Pick up the new questions.
     toc = time.perf_counter()
     mins = float((toc - tic) / 60)
     print(
@@ -101,8 +257,8 @@ def make_all_questions():
 def who_is_the_oldest_dj():
     """Create questions where the oldest DJ is the answer."""
     reverse_display_answers = False
-    results_named_tuple = playlists.get_djs_by_first_show(
-        reverse=reverse_display_answers)
+    results_named_tuple = djs.dj_directory.get().sorted_stats(
+        'firstshow', reverse=reverse_display_answers)
     ask_questions = [
         "From these choices, who graduated Radio 90A (DJ Training) first?",
         "Out of these four, who has been a KFJC DJ the longest?",
@@ -125,8 +281,8 @@ def who_is_the_oldest_dj():
 def who_is_the_newest_dj():
     """Create questions where the newest DJ is the answer."""
     reverse_display_answers = True
-    results_named_tuple = playlists.get_djs_by_first_show(
-        reverse=reverse_display_answers)
+    results_named_tuple = djs.dj_directory.get().sorted_stats(
+        'firstshow', reverse=reverse_display_answers)
     ask_questions = [
         "From these choices, who graduated Radio 90A (DJ Training) last?",
         "Spot the greenhorn! From these choices, who is the most recent "
@@ -149,7 +305,7 @@ def who_is_the_newest_dj():
 def who_has_the_most_shows():
     """Create questions where the DJ with the most shows is the answer."""
     reverse_display_answers = True
-    results_named_tuple = playlists.get_djs_by_show_count()
+    results_named_tuple = djs.dj_directory.get().sorted_stats('showcount')
     ask_questions = [
         "From these choices, which KFJC DJ has the most shows?",
         "Out of these four, who has done the most shows?",
@@ -172,6 +328,7 @@ def dj_competition_engine(
         present_answers: List[str], reverse_display_answers: bool,
         present_answer_data_headings: List[str], search_key: str):
     """Create DJ Comparison Questions."""
+    air_names = djs.get_all_airnames()
     winner_slice = results_named_tuple[:SEED_QUESTION_COUNT]  # Top 30
     loser_slice = results_named_tuple[SEED_QUESTION_COUNT:]  # Everyone Else
     for the_right_answer in winner_slice:
@@ -192,7 +349,7 @@ def dj_competition_engine(
             else:  # Last Show
                 item_value = common.make_date_pretty(
                     date_time_string=zz.lastshow)
-            air_name = djs.get_airname_for_dj(dj_id=zz.dj_id)
+            air_name = air_names[zz.dj_id].plain
             present_answer_data.append([air_name, item_value])
             display_shuffled_answers.append(air_name)
 
@@ -215,8 +372,9 @@ def dj_competition_engine(
 
 def when_was_dj_last_on_the_air():
     """Create questions where the date of a DJ's last show is the answer."""
-    results_named_tuple = playlists.get_djs_by_last_show(reverse=False)
+    results_named_tuple = djs.dj_directory.get().sorted_stats('lastshow')
     random_last_shows = choices(results_named_tuple, k=SEED_QUESTION_COUNT)
+    air_names = djs.get_all_airnames()
     for last_show in random_last_shows:
         the_right_answer = last_show.lastshow  # A Datetime Object.
         three_wrong_answers = random_date_surrounding_another_date(
@@ -225,9 +383,7 @@ def when_was_dj_last_on_the_air():
             date_time_string=the_right_answer)
         answer_pile = [the_pretty_right_answer] + three_wrong_answers
         dj_id = last_show.dj_id
-        air_name = djs.get_airname_for_dj(dj_id=dj_id, posessive=False)
-        air_name_posessive = djs.get_airname_for_dj(
-            dj_id=dj_id, posessive=True)
+        air_name, air_name_posessive = air_names[dj_id]
         ask_questions = [
             f"Can you guess {air_name_posessive} most recent show?",
             f"When was {air_name} last on the air?",
@@ -265,6 +421,7 @@ def dj_favorites_engine(media: str):
     """Create questions where a DJ's most played media is the answer."""
     dj_id_pool = playlists.get_all_dj_ids()
     x_random_dj_ids = choices(dj_id_pool, k=SEED_QUESTION_COUNT)
+    air_names = djs.get_all_airnames()
     for dj_id in x_random_dj_ids:
         if media == 'artist':
             answer_key = playlist_tracks.get_favorite_artists(
@@ -279,9 +436,7 @@ def dj_favorites_engine(media: str):
             # Some Djs are so new they don't have a body of work
             # large enough to produce favorites scores:
             continue
-        air_name = djs.get_airname_for_dj(dj_id=dj_id)
-        air_name_posessive = djs.get_airname_for_dj(
-            dj_id=dj_id, posessive=True)
+        air_name, air_name_posessive = air_names[dj_id]
         dj_favorites = answer_key[:5]
         less_favorite = answer_key[5:]
         for the_right_answer in dj_favorites:
@@ -419,15 +574,11 @@ def top_ten_engine(media: str):
 
 
 def get_four_random_albums() -> List[Album]:
-    """Four random album objects for question creation."""
-    four_random_albums = []
-    for _ in range(4):
-        # Get 4 random albums:
-        random_kfjc_album_id = playlist_tracks.get_a_random_kfjc_album_id()
-        random_album = albums.get_album_by_id(
-            kfjc_album_id=random_kfjc_album_id)
-        four_random_albums.append(random_album)
-    return four_random_albums
+    """Four different random album objects for question creation;
+    fewer if the library doesn't have four."""
+    return albums.get_albums_by_ids(
+        kfjc_album_ids=playlist_tracks.sample_library(
+            pick_type='kfjc_album_id', k=4))
 
 
 def albums_by_an_artist():
@@ -435,6 +586,8 @@ def albums_by_an_artist():
     question_type = "A Question about an Album:"
     for _ in range(SEED_QUESTION_COUNT):
         four_random_albums = get_four_random_albums()
+        if len(four_random_albums) < 4:
+            continue  # Too small a library.
         # The first album shall be the winner:
         winner_artist = four_random_albums[0].artist
         winner_album_title = four_random_albums[0].title
@@ -469,6 +622,8 @@ def artist_of_an_album():
     """Formulate a question about artist of an album."""
     for _ in range(SEED_QUESTION_COUNT):
         four_random_albums = get_four_random_albums()
+        if len(four_random_albums) < 4:
+            continue  # Too small a library.
         # The first album shall be the winner:
         winner_artist = four_random_albums[0].artist
         winner_album_title = four_random_albums[0].title
@@ -518,6 +673,8 @@ def tracks_on_an_album():
     question_type = "A Question about a Track:"
     for _ in range(SEED_QUESTION_COUNT):
         four_random_albums = get_four_random_albums()
+        if len(four_random_albums) < 4:
+            continue  # Too small a library.
         # The first album shall be the winner:
         winner_artist = four_random_albums[0].artist
         winner_album_title = four_random_albums[0].title
@@ -576,13 +733,10 @@ def create_last_play_questions():
 
 def last_play_engine(media: str):
     """Create a question about the last time a media was played."""
-    for _ in range(SEED_QUESTION_COUNT):
-        if media == 'artist':
-            random_media = playlist_tracks.get_a_random_artist()
-        elif media == 'album':
-            random_media = playlist_tracks.get_a_random_album()
-        else:  # 'track'
-            random_media = playlist_tracks.get_a_random_track()
+    air_names = djs.get_all_airnames()
+    # One question each for SEED_QUESTION_COUNT different media:
+    for random_media in playlist_tracks.sample_library(
+            pick_type=media, k=SEED_QUESTION_COUNT):
         if not random_media:
             continue  # Dud list.
         ask_questions = [
@@ -623,7 +777,7 @@ def last_play_engine(media: str):
         shuffle(answer_pile)
         present_answer_data = []
         for zz in answer_key:
-            air_name = djs.get_airname_for_dj(dj_id=zz.dj_id)
+            air_name = air_names[zz.dj_id].plain
             pretty_date = common.make_date_pretty(
                 date_time_string=zz.time_played)
             present_answer_data.append([
@@ -0,0 +1,453 @@
+"""Trigram index over artist, album and track names for KFJC Trivia Robot.
+
+The /last_played and /artists_albums searches match LOWER(column) LIKE
+'%word%word%', which reads the whole table. This index maps every three
+letters in a row in those names to the ids of the rows that have them.
+A name that matches the LIKE has every trigram of every search word
+somewhere in it, so the rows with all of them are all the LIKE has to
+check, by primary key.
+
+build_search_index writes it to one file after an import; the server
+memory-maps that file, so a worker's start-up costs almost nothing.
+The build sorts the postings in runs on disk and merges them, so it
+never holds a whole field's postings in memory.
+
+The typeahead suggests the most played names starting with what a user
+has typed so far, from library_picks.
+"""
+
+import os
+import re
+import mmap
+import heapq
+import shutil
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+from typing import (
+    List, Dict, Set, Tuple, Optional, NamedTuple, BinaryIO, Iterator)
+
+from model import db, connect_to_db, PlaylistTrack, Track, LibraryPick
+import common
+
+SEARCH_INDEX_PATH = 'search_index.bin'
+SEARCH_INDEX_MAX_IDS = 5000  # More candidates than this: let SQL search.
+SEARCH_INDEX_CHECK_SECONDS = 60  # How often to look for a new file.
+SEARCH_INDEX_RUN_IDS = 2000000  # Postings held in memory while building.
+MAGIC = b'KFJCIDX2'
+
+# field -> (table, id column, name column)
+SEARCH_FIELDS = {
+    'artist': (PlaylistTrack, 'id_', 'artist'),
+    'album_title': (PlaylistTrack, 'id_', 'album_title'),
+    'track_title': (PlaylistTrack, 'id_', 'track_title'),
+    'tracks.artist': (Track, 'id_', 'artist')}
+# LIKE reads % as anything, _ as any one character and \ as an escape.
+LIKE_SPECIAL_REGEX = re.compile(r"[%_\\]")
+# Typeahead media -> library_picks category
+TYPEAHEAD_CATEGORIES = {
+    'artist': 'artist', 'album': 'album_title', 'track': 'track_title'}
+TYPEAHEAD_TOP_K = 10
+TYPEAHEAD_SCAN_LIMIT = 200  # Prefixes of more names are answered in advance.
+TYPEAHEAD_SECONDS = 3600  # How often the server re-reads library_picks.
+
+
+def trigrams_in(name: Optional[str]) -> Set[str]:
+    """Every three characters in a row, spaces and punctuation too.
+
+    >>> sorted(trigrams_in("Bishop"))
+    ['bis', 'hop', 'ish', 'sho']
+    >>> trigrams_in("Ox")
+    set()
+    """
+    if not name:
+        return set()
+    name = name.lower()
+    return {
+        name[i:i + 3] for i in range(len(name) - 2)
+        if "\n" not in name[i:i + 3]}  # The file splits keys on newlines.
+
+
+def trigrams_in_search(query: str) -> Set[str]:
+    """Trigrams every LIKE '%word%word%' match must have. Words shorter
+    than three letters, and LIKE wildcards, rule nothing out.
+
+    >>> sorted(trigrams_in_search("hip hop"))
+    ['hip', 'hop']
+    >>> sorted(trigrams_in_search("h i p  h o p"))
+    []
+    >>> sorted(trigrams_in_search("ab_cd"))
+    []
+    """
+    trigrams = set()
+    for word in query.split():
+        for piece in LIKE_SPECIAL_REGEX.split(word):
+            trigrams |= trigrams_in(piece)
+    return trigrams
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- Build the Index File -=-=-=-=-=-=-=-=-=-=-=-
+
+
+def build_search_index(path: str = SEARCH_INDEX_PATH) -> str:
+    """Index every name in the database. Run at the end of every import.
+
+    Written next to the old file, then swapped in, so a running server
+    never reads half a file."""
+
+    fingerprint = database_fingerprint()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<QQI', *fingerprint, len(SEARCH_FIELDS)))
+        for field in SEARCH_FIELDS:
+            write_field(file=file, field=field, runs=write_runs(field=field))
+    os.replace(temp_path, path)
+    return path
+
+
+def write_runs(field: str) -> List[BinaryIO]:
+    """Postings for a field's names, trigram -> ids, in sorted runs on
+    disk of about SEARCH_INDEX_RUN_IDS ids each.
+
+    Rows come in id order, so every id in a run is bigger than every id
+    in the runs before it."""
+
+    table, id_column, name_column = SEARCH_FIELDS[field]
+    runs = []
+    postings = {}
+    id_count = 0
+    for row_id, name in db.session.query(
+            getattr(table, id_column), getattr(table, name_column)).filter(
+            getattr(table, name_column) != 'None').order_by(
+            getattr(table, id_column)).yield_per(10000):
+        for trigram in trigrams_in(name):
+            postings.setdefault(trigram, array('I')).append(row_id)
+            id_count += 1
+        if id_count >= SEARCH_INDEX_RUN_IDS:
+            runs.append(write_run(postings=postings))
+            postings = {}
+            id_count = 0
+    if postings:
+        runs.append(write_run(postings=postings))
+    return runs
+
+
+RUN_ENTRY = struct.Struct('<HI')  # Trigram bytes, id count.
+
+
+def write_run(postings: Dict[str, array]) -> BinaryIO:
+    """Write postings to a temporary file in trigram order; read it back
+    with read_run.
+
+    >>> run = write_run({'hop': array('I', [3, 9]), 'bis': array('I', [9])})
+    >>> [(key, array('I', ids).tolist()) for key, ids in read_run(run)]
+    [('bis', [9]), ('hop', [3, 9])]
+    """
+    run = tempfile.TemporaryFile()
+    for key in sorted(postings):
+        key_bytes = key.encode()
+        run.write(RUN_ENTRY.pack(len(key_bytes), len(postings[key])))
+        run.write(key_bytes)
+        run.write(postings[key].tobytes())
+    run.seek(0)
+    return run
+
+
+def read_run(run: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    """(trigram, its ids as bytes) from a run, then close it."""
+    with run:
+        for entry in iter(partial(run.read, RUN_ENTRY.size), b''):
+            key_length, id_count = RUN_ENTRY.unpack(entry)
+            yield run.read(key_length).decode(), run.read(4 * id_count)
+
+
+def write_field(file, field: str, runs: List[BinaryIO]):
+    """Field name, sorted trigrams, then offsets into one long id array.
+
+    The runs are merged trigram by trigram; a trigram's ids go in run
+    order, which keeps them ascending. They wait in a temporary file
+    until the trigrams and offsets are written."""
+
+    keys = []
+    offsets = array('Q', [0])
+    with tempfile.TemporaryFile() as ids_file:
+        merged = heapq.merge(*map(read_run, runs), key=itemgetter(0))
+        for key, entries in groupby(merged, key=itemgetter(0)):
+            id_count = 0
+            for _, id_bytes in entries:
+                ids_file.write(id_bytes)
+                id_count += len(id_bytes) // 4
+            keys.append(key)
+            offsets.append(offsets[-1] + id_count)
+        key_bytes = "\n".join(keys).encode()
+
+        field_bytes = field.encode()
+        file.write(struct.pack('<I', len(field_bytes)))
+        file.write(field_bytes)
+        file.write(struct.pack('<QQ', len(keys), len(key_bytes)))
+        file.write(key_bytes)
+        file.write(bytes(-file.tell() % 8))  # Line the arrays up.
+        file.write(offsets.tobytes())
+        ids_file.seek(0)
+        shutil.copyfileobj(ids_file, file)
+    file.write(bytes(-file.tell() % 8))
+
+
+def database_fingerprint() -> Tuple[int, int]:
+    """Newest playlist_tracks and tracks ids: an index built on another
+    copy of the database won't match."""
+
+    return (
+        db.session.query(db.func.max(PlaylistTrack.id_)).scalar() or 0,
+        db.session.query(db.func.max(Track.id_)).scalar() or 0)
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- Read the Index File -=-=-=-=-=-=-=-=-=-=-=-
+
+
+class SearchIndex:
+    """A memory-mapped search_index file. Only the trigram lists are
+    read into memory; the ids stay in the page cache."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        if bytes(view[:8]) != MAGIC:
+            raise ValueError(f"{path} is not a search index.")
+        playlist_tracks_id, tracks_id, field_count = struct.unpack_from(
+            '<QQI', view, 8)
+        self.fingerprint = (playlist_tracks_id, tracks_id)
+        self.fields = {}
+        position = 8 + struct.calcsize('<QQI')
+        for _ in range(field_count):
+            name_length, = struct.unpack_from('<I', view, position)
+            position += 4
+            field = bytes(view[position:position + name_length]).decode()
+            position += name_length
+            key_count, key_length = struct.unpack_from(
+                '<QQ', view, position)
+            position += 16
+            keys = bytes(view[position:position + key_length]).decode()
+            keys = keys.split("\n") if key_count else []
+            position += key_length
+            position += -position % 8
+            offsets_length = 8 * (key_count + 1)
+            offsets = view[position:position + offsets_length].cast('Q')
+            position += offsets_length
+            row_ids = view[position:position + 4 * offsets[-1]].cast('I')
+            position += 4 * offsets[-1]
+            position += -position % 8
+            self.fields[field] = (keys, offsets, row_ids)
+
+    def matching_ids(self, field: str, query: str) -> Optional[List[int]]:
+        """Ids of rows with every trigram of the query: every row the
+        caller's LIKE can match, and some it won't (word order).
+
+        None when there are too many to be worth it."""
+        trigrams, offsets, row_ids = self.fields[field]
+        candidates = None
+        spans = []
+        for trigram in trigrams_in_search(query):
+            first = bisect_left(trigrams, trigram)
+            if first == len(trigrams) or trigrams[first] != trigram:
+                return []  # No name has it, so no name matches.
+            spans.append((offsets[first + 1] - offsets[first], first))
+        for size, first in sorted(spans):  # Rarest trigrams first.
+            if size > SEARCH_INDEX_MAX_IDS:
+                break
+            span_ids = set(row_ids[offsets[first]:offsets[first + 1]])
+            candidates = span_ids if candidates is None else (
+                candidates & span_ids)
+        if candidates is None:
+            return None
+        return sorted(candidates)
+
+
+class SearchIndexFile:
+    """The current SearchIndex for a path, looked at again every
+    SEARCH_INDEX_CHECK_SECONDS and reread if the file was replaced.
+    None if there is no file, or it was built from a different
+    database."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.opened = common.SharedCache(
+            load=self.reopen, max_seconds=SEARCH_INDEX_CHECK_SECONDS)
+
+    def current(self) -> Optional[SearchIndex]:
+        _, index = self.opened.get()
+        return index
+
+    def reopen(
+            self) -> Tuple[Optional[Tuple[int, int]], Optional[SearchIndex]]:
+        """The file's (size, mtime) and its SearchIndex."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, None
+        signature = (stat.st_size, stat.st_mtime_ns)
+        last_signature, index = self.opened.value or (None, None)
+        if signature != last_signature or index is None:
+            try:
+                index = SearchIndex(self.path)
+            except ValueError as error:  # An older file format.
+                print(error)
+                return signature, None
+        if index and index.fingerprint != database_fingerprint():
+            print(f"{self.path} is out of date; not using it.")
+            index = None
+        return signature, index
+
+
+names_index = SearchIndexFile(SEARCH_INDEX_PATH)
+
+
+def matching_ids(field: str, query: str) -> Optional[List[int]]:
+    """Candidate row ids for a name search, or None to search in SQL."""
+
+    index = names_index.current()
+    if index is None:
+        return None
+    return index.matching_ids(field=field, query=query)
+
+
+# -=-=-=-=-=-=-=-=-=-=-=- Typeahead -=-=-=-=-=-=-=-=-=-=-=-
+
+
+class Suggestion(NamedTuple):
+    name: str
+    plays: int
+
+
+class PrefixIndex:
+    """The names in one list, most played first, and their positions in
+    lowercase order, so the names starting with a prefix are one bisected
+    range. A prefix with a range longer than scan_limit has its top
+    names worked out up front; any other is ranked per keystroke.
+
+    >>> names = [
+    ...     Suggestion('The Meditations', 9), Suggestion('Delixx', 6),
+    ...     Suggestion('The Damned', 4), Suggestion('Theo Parrish', 2)]
+    >>> for scan_limit in [200, 1]:
+    ...     index = PrefixIndex(names, scan_limit=scan_limit)
+    ...     print([suggestion.name for suggestion in index.lookup('THE', k=2)],
+    ...           index.lookup('the d', k=5))
+    ['The Meditations', 'The Damned'] [Suggestion(name='The Damned', plays=4)]
+    ['The Meditations', 'The Damned'] [Suggestion(name='The Damned', plays=4)]
+    >>> sorted(PrefixIndex(names, scan_limit=1).top)
+    ['t', 'th', 'the', 'the ']
+    """
+
+    def __init__(
+            self, suggestions: List[Suggestion],
+            scan_limit: int = TYPEAHEAD_SCAN_LIMIT):
+        """suggestions: most played first."""
+        self.suggestions = suggestions
+        self.order = array('I', sorted(
+            range(len(suggestions)),
+            key=lambda position: suggestions[position].name.lower()))
+        self.top = {}  # prefix -> positions of its most played names
+        self.find_long_ranges(scan_limit=scan_limit)
+
+    def key(self, place: int) -> str:
+        return self.suggestions[self.order[place]].name.lower()
+
+    def bisect(self, key: str, first: int, last: int) -> int:
+        """Where key goes among self.order[first:last], in lowercase order."""
+        while first < last:
+            middle = (first + last) // 2
+            if self.key(middle) < key:
+                first = middle + 1
+            else:
+                last = middle
+        return first
+
+    def span(self, prefix: str, first: int, last: int) -> Tuple[int, int]:
+        """The range of self.order[first:last] starting with prefix."""
+        first = self.bisect(prefix, first, last)
+        return first, self.bisect(prefix + '\U0010ffff', first, last)
+
+    def find_long_ranges(self, scan_limit: int):
+        """Rank the prefixes that start more than scan_limit names, one
+        letter longer at a time; only a long range has long ones in it."""
+        ranges = [("", 0, len(self.order))]
+        while ranges:
+            longer_ranges = []
+            for prefix, first, last in ranges:
+                length = len(prefix) + 1
+                while first < last:
+                    longer = self.key(first)[:length]
+                    if len(longer) < length:  # The name is the prefix.
+                        first += 1
+                        continue
+                    _, end = self.span(longer, first, last)
+                    if end - first > scan_limit:
+                        self.top[longer] = tuple(heapq.nsmallest(
+                            TYPEAHEAD_TOP_K, self.order[first:end]))
+                        longer_ranges.append((longer, first, end))
+                    first = end
+            ranges = longer_ranges
+
+    def lookup(
+            self, prefix: str, k: int = TYPEAHEAD_TOP_K) -> List[Suggestion]:
+        """The k most played names starting with prefix, any case."""
+        prefix = prefix.lower().lstrip()
+        if not prefix:
+            return []
+        top = self.top.get(prefix)
+        if top is None:
+            first, last = self.span(prefix, 0, len(self.order))
+            top = heapq.nsmallest(k, self.order[first:last])
+        return [self.suggestions[position] for position in top[:k]]
+
+
+def load_prefix_index(media: str) -> PrefixIndex:
+    return PrefixIndex([
+        Suggestion(name=item, plays=appearances)
+        for item, appearances in db.session.query(
+            LibraryPick.item, LibraryPick.appearances).filter(
+            LibraryPick.category == TYPEAHEAD_CATEGORIES[media]
+        ).order_by(LibraryPick.pick_number)])
+
+
+# A PrefixIndex per media, rebuilt in the background every
+# TYPEAHEAD_SECONDS so a weekly_update shows up without a restart.
+typeahead_names = {
+    media: common.SharedCache(
+        load=partial(load_prefix_index, media), max_seconds=TYPEAHEAD_SECONDS)
+    for media in TYPEAHEAD_CATEGORIES}
+
+
+def refresh_typeahead():
+    """Build every PrefixIndex now, so no keystroke waits for one.
+    Run at start-up and at the end of every import."""
+
+    for prefix_index in typeahead_names.values():
+        prefix_index.refresh()
+
+
+def typeahead(
+        media: str, prefix: str, k: int = TYPEAHEAD_TOP_K
+) -> List[Suggestion]:
+    """The most played artists, albums or tracks starting with prefix."""
+
+    return typeahead_names[media].get().lookup(
+        prefix=prefix, k=min(k, TYPEAHEAD_TOP_K))
+
+
+if __name__ == '__main__':
+    """Will connect you to the database when you run
+    search_index.py interactively"""
+    from server import app
+
+    connect_to_db(app)
+
+    import doctest
+
+    doctest.testmod()  # python3 search_index.py -v
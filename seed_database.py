@@ -6,9 +6,18 @@ from server import app
 from model import db, connect_to_db
 
 import import_station_data as kfjc
+import bulk_import
+import playlist_tracks
+import station_stats
+import search_index
 import questions
 
 DB_NAME = "trivia"
+IMPORT_ENGINES = {
+    'orm': kfjc.import_all_tables,  # One ORM object per row. Takes hours.
+    'copy': bulk_import.import_all_tables_with_copy,  # COPY FROM STDIN.
+    'pipeline': bulk_import.import_all_tables_with_pipeline,  # COPY, cleaned on every core.
+}
 
 
 def recreate_all_tables():
@@ -20,17 +29,60 @@ def recreate_all_tables():
     db.create_all()
 
 
-def nuclear_option():
-    """Import and fix all Station Data and Seed All Questions."""
+def nuclear_option(engine: str = 'orm'):
+    """Import and fix all Station Data and Seed All Questions.
+
+    Pick an import engine from IMPORT_ENGINES: nuclear_option('copy')
+    """
+    import_all_tables = IMPORT_ENGINES[engine]  # Fail before deleting data.
     recreate_all_tables()  # I DELETE DATA!
 
     tic = time.perf_counter()
-    kfjc.import_all_tables()
+    import_all_tables()
     toc = time.perf_counter()
-    questions.make_all_questions()
+    after_import()
+    hours = float((toc - tic) / 3600)
+    print(f"Importing Station Data took {hours:0.4f} hours.")
+
+
+def resume_import(engine: str = 'orm'):
+    """Pick a crashed nuclear_option back up at its last checkpoint,
+    then seed the questions."""
+    import_all_tables = IMPORT_ENGINES[engine]
+
+    tic = time.perf_counter()
+    import_all_tables(resume=True)
+    toc = time.perf_counter()
+    after_import()
     hours = float((toc - tic) / 3600)
     print(f"Importing Station Data took {hours:0.4f} hours.")
 
 
+def weekly_update(max_workers: int = 1):
+    """Import only the new Station Data and seed more questions.
+
+    Nothing is dropped: users, answers and existing questions stay put.
+    Edits to older shows, and tracks added to older albums, are not
+    picked up; nuclear_option() reloads everything.
+    """
+    tic = time.perf_counter()
+    bulk_import.import_new_rows_with_copy(max_workers=max_workers)
+    toc = time.perf_counter()
+    after_import()
+    hours = float((toc - tic) / 3600)
+    print(f"Importing new Station Data took {hours:0.4f} hours.")
+
+
+def after_import():
+    """Everything counted from the Station Data, and the new questions.
+    Run at the end of every import."""
+    playlist_tracks.create_playlist_tracks_indexes()
+    station_stats.refresh_station_stats()
+    playlist_tracks.refresh_library_picks()
+    playlist_tracks.refresh_weekly_plays()
+    search_index.build_search_index()
+    questions.make_all_questions()
+
+
 if __name__ == "__main__":
     connect_to_db(app)
@@ -1,12 +1,15 @@
 """Server for KFJC Trivia Robot app."""
 
 import os
+import json
+from datetime import datetime
 from random import choice
-from typing import List, Dict, Any, Tuple, Union
+from typing import List, Dict, Any, Union
 from jinja2 import StrictUndefined
-from operator import itemgetter
-from flask import (Flask, render_template, request, flash, session, redirect)
-from flask_restful import Api, Resource  # reqparse
+from flask import (
+    Flask, render_template, request, flash, session, redirect,
+    stream_with_context)
+from flask_restful import Api, Resource, abort  # reqparse
 from flask_marshmallow import Marshmallow
 from flask_restful_swagger import swagger
 from werkzeug.wrappers import Response
@@ -14,13 +17,14 @@ from werkzeug.wrappers import Response
 from model import (
     db, connect_to_db, Answer, Playlist, PlaylistTrack, Album, Track)
 import djs
-import playlists
 import playlist_tracks
 import tracks
 import albums
 import users
 import questions
 import answers
+import station_stats
+import search_index
 import common
 
 app = Flask(__name__)
@@ -35,8 +39,6 @@ ROBOT_MSG = [
     "Robot loves you!", "Pretty good, meatbag!",
     "Well done, bag of mostly water!", "Pretty good for a human!",
     "Robot is proud of you!"]
-dj_dict = {}
-dj_airnames = []
 
 
 # -=-=-=-=-=-=-=-=-=-=-=- Routes -=-=-=-=-=-=-=-=-=-=-=-
@@ -46,9 +48,6 @@ dj_airnames = []
 def homepage() -> Response:
     """Display homepage."""
 
-    if not dj_dict or not dj_airnames:
-        retrieve_dj_stats_only_once()
-
     return render_template(
         'homepage.html',
         random_robot_img=random_robot_image(),
@@ -194,6 +193,7 @@ def answer_question() -> Response:
         question_instance=question,
         answer_given=answer_given)
     db.session.commit()
+    answers.answer_committed(answer=answer)
 
     if answer_given == "SKIP":  # That's a skip.
         return redirect('/question')
@@ -220,26 +220,23 @@ def answer_question() -> Response:
 @app.route("/ask")
 def user_asks() -> Response:
     """user can ask the robot a question!"""
-    if not dj_dict or not dj_airnames:
-        retrieve_dj_stats_only_once()
-
     if "user_id" not in session:
         return redirect('/important')
 
+    directory = djs.dj_directory.get()
     dj_id = request.args.get("dj_id")
     if not dj_id:
-        print(dj_airnames[0])
-        selected_dj_id = choice(dj_airnames)[0]
+        selected_dj_id = choice(directory.dj_airnames)[0]
     else:
         selected_dj_id = int(dj_id)  # Only strings come back from forms.
     session['selected_dj_id'] = selected_dj_id
-    dj_stat = dj_dict[selected_dj_id]['dj_stats']
+    dj_stat = directory.dj_dict[selected_dj_id]['dj_stats']
 
     return render_template(
         'ask.html',
         random_robot_img=random_robot_image(),
-        dj_airnames=dj_airnames,
-        dj_dict=dj_dict,
+        dj_airnames=directory.dj_airnames,
+        dj_dict=directory.dj_dict,
         dj_most_plays_headings=False,
         selected_dj_id=session['selected_dj_id'],
         dj_stat=dj_stat,
@@ -253,7 +250,9 @@ def leaderboard() -> Response:
     if "user_id" not in session:
         return redirect('/important')
 
-    score_board = answers.compile_leaderboard()
+    snapshot = answers.leaderboard.get()
+    score_board = answers.compile_leaderboard(
+        top_n=TOP_N_USERS, scores=snapshot.scores)
 
     table_range = min(TOP_N_USERS, len(score_board))
     if session["user_id"] in [f[0] for f in score_board[:table_range]]:
@@ -261,7 +260,7 @@ def leaderboard() -> Response:
     else:
         user_msg = f"Our Top{TOP_N_USERS} Leaders:"
 
-    return render_template(
+    page = app.make_response(render_template(
         'leaderboard.html',
         random_robot_img=random_robot_image(),
         robot_msg=choice(ROBOT_MSG),
@@ -269,7 +268,12 @@ def leaderboard() -> Response:
         current_user=session["user_id"],
         user_msg=user_msg,
         leaders=score_board,
-        footer='private')
+        footer='private'))
+    # The page highlights the viewer, so each user gets their own etag:
+    page.vary.add('Cookie')
+    return conditional_response(
+        response=page, etag=f"{snapshot.etag}-{session['user_id']}",
+        last_modified=snapshot.last_modified)
 
 
 # -=-=-=-=-=-=-=-=-=-=-=- Python -=-=-=-=-=-=-=-=-=-=-=-
@@ -291,16 +295,14 @@ def random_robot_image(happy: Union[bool, None] = None) -> str:
 def assemble_greeting() -> str:
     """Gather stats for to make a compelling reason to take a database quiz."""
 
-    first_show, last_show = playlists.first_show_last_show()
-    first_show_in_db = common.make_date_pretty(first_show)
-    last_show_in_db = common.make_date_pretty(last_show)
-    count_all_shows = common.format_an_int_with_commas(
-        playlists.how_many_shows())
-    count_prolific_djs = common.format_an_int_with_commas(
-        playlists.how_many_djs())
-    count_playlist_tracks = common.format_an_int_with_commas(
-        playlist_tracks.how_many_tracks())
-    duration = common.minutes_to_years(((last_show - first_show).total_seconds()) / 60)
+    stats = station_stats.greeting_stats.get()  # Counted at import.
+    first_show_in_db = common.make_date_pretty(stats.first_show)
+    last_show_in_db = common.make_date_pretty(stats.last_show)
+    count_all_shows = common.format_an_int_with_commas(stats.shows)
+    count_prolific_djs = common.format_an_int_with_commas(stats.djs)
+    count_playlist_tracks = common.format_an_int_with_commas(stats.tracks)
+    duration = common.minutes_to_years(
+        ((stats.last_show - stats.first_show).total_seconds()) / 60)
     greeting = (
         f"KFJC has a database going back to {first_show_in_db} "
         f"that contains {count_all_shows} shows by {count_prolific_djs} DJs. "
@@ -310,28 +312,14 @@ def assemble_greeting() -> str:
     return greeting
 
 
-def retrieve_dj_stats_only_once() -> Tuple:
-    djs_alphabetically = playlists.get_djs_alphabetically()
-    for zz in djs_alphabetically:
-        dj_id = zz.dj_id
-        air_name = djs.get_airname_for_dj(dj_id=dj_id)
-        air_name_posessive = djs.get_airname_for_dj(
-            dj_id=dj_id, posessive=True)
-        showcount = common.format_an_int_with_commas(zz.showcount)
-        firstshow = common.make_date_pretty(zz.firstshow)
-        lastshow = common.make_date_pretty(zz.lastshow)
-        dj_stats = (
-            f"{air_name_posessive} first show was on {firstshow}, "
-            f"their last show was on {lastshow} and they have done "
-            f"{showcount} shows!")
-        dj_dict[dj_id] = {
-            'air_name': air_name,
-            'showcount': showcount,
-            'firstshow': firstshow,
-            'lastshow': lastshow,
-            'dj_stats': dj_stats}
-        dj_airnames.append([dj_id, air_name])
-    return dj_dict, dj_airnames
+def conditional_response(
+        response: Response, etag: str, last_modified: datetime) -> Response:
+    """Tag a response with its version; a 304 if the client has it."""
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True  # Keep it, but ask every time.
+    return response.make_conditional(request)
 
 
 # -=-=-=-=-=-=-=-=-=-=-=- REST API: Leaderboard -=-=-=-=-=-=-=-=-=-=-=-
@@ -378,23 +366,15 @@ class LeaderboardResource(Resource):
             }
         ]
     )
-    def get(self) -> List[Dict[str, Any]]:
-        score_board = []
-        for user in users.get_users():
-            user_score = {}
-            user_score_named_tuple = answers.get_user_score(
-                user_id=user.user_id)
-            user_score["username"] = user.username
-            user_score["fname"] = user.fname
-            user_score["passed"] = user_score_named_tuple.passed
-            user_score["failed"] = user_score_named_tuple.failed
-            user_score["skipped"] = user_score_named_tuple.skipped
-            user_score["questions"] = user_score_named_tuple.questions
-            user_score["percent"] = user_score_named_tuple.percent
-            score_board.append(user_score)
-
-        score_board.sort(key=itemgetter("percent"), reverse=True)
-        return leaderboard_schema.dump(score_board)
+    def get(self) -> Response:
+        snapshot = answers.leaderboard.get()
+        # Already in order of percent:
+        score_board = [
+            user_score._asdict() for user_score in snapshot.scores]
+        return conditional_response(
+            response=api.make_response(
+                leaderboard_schema.dump(score_board), 200),
+            etag=snapshot.etag, last_modified=snapshot.last_modified)
 
 
 # Don't make a confilct with @app.route("/leaderboard")
@@ -667,6 +647,55 @@ class LastPlayedSchema(ma.Schema):
 
 
 last_played_schema = LastPlayedSchema(many=True)
+last_play_schema = LastPlayedSchema()
+
+
+def last_played_response(
+        search_column_name: str, search_for_item: str) -> Response:
+    """Newest plays first, a page at a time. Send a page's X-Next-Cursor
+    header back as ?after= for the next one; ?page_size= up to LIMITER.
+
+    ?format=ndjson streams every play instead, one JSON object per line,
+    each with the cursor to resume after it."""
+
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            playlist_tracks.parse_last_play_cursor(after)
+        except ValueError:
+            abort(400, message=f"Not a cursor: {after}")
+    page_size = request.args.get('page_size', type=int)
+    if page_size is not None and page_size < 1:
+        abort(400, message=f"page_size must be 1 or more, not {page_size}.")
+
+    if request.args.get('format') == 'ndjson':
+        last_plays = playlist_tracks.stream_last_plays(
+            search_column_name=search_column_name,
+            search_for_item=search_for_item, reverse=True,
+            page_size=page_size, after=after)
+
+        def one_per_line():
+            for last_play in last_plays:
+                yield json.dumps(dict(
+                    last_play_schema.dump(dict(last_play)),
+                    cursor=playlist_tracks.last_play_cursor(last_play))) + "\n"
+
+        return Response(
+            stream_with_context(one_per_line()),
+            mimetype='application/x-ndjson')
+
+    page_size = min(
+        page_size or playlist_tracks.LIMITER, playlist_tracks.LIMITER)
+    last_time_played = playlist_tracks.last_time_played(
+        search_column_name=search_column_name,
+        search_for_item=search_for_item, reverse=True,
+        page_size=page_size, after=after)
+    response = api.make_response(
+        last_played_schema.dump(last_time_played), 200)
+    if len(last_time_played) == page_size:
+        response.headers['X-Next-Cursor'] = playlist_tracks.last_play_cursor(
+            last_time_played[-1])
+    return response
 
 
 @swagger.model
@@ -698,10 +727,9 @@ class LastPlayedByArtist(Resource):
             }
         ]
     )
-    def get(self, artist: str) -> List[Dict[str, Any]]:
-        last_time_played = playlist_tracks.get_last_play_of_artist(
-            artist=artist, reverse=True)
-        return last_played_schema.dump(last_time_played)
+    def get(self, artist: str) -> Response:
+        return last_played_response(
+            search_column_name="artist", search_for_item=artist)
 
 
 @swagger.model
@@ -733,10 +761,9 @@ class LastPlayedByAlbum(Resource):
             }
         ]
     )
-    def get(self, album: str) -> List[Dict[str, Any]]:
-        last_time_played = playlist_tracks.get_last_play_of_album(
-            album=album, reverse=True)
-        return last_played_schema.dump(last_time_played)
+    def get(self, album: str) -> Response:
+        return last_played_response(
+            search_column_name="album_title", search_for_item=album)
 
 
 @swagger.model
@@ -768,10 +795,9 @@ class LastPlayedByTrack(Resource):
             }
         ]
     )
-    def get(self, track: str) -> List[Dict[str, Any]]:
-        last_time_played = playlist_tracks.get_last_play_of_track(
-            track=track, reverse=True)
-        return last_played_schema.dump(last_time_played)
+    def get(self, track: str) -> Response:
+        return last_played_response(
+            search_column_name="track_title", search_for_item=track)
 
 
 api.add_resource(LastPlayedByArtist, '/last_played/artist=<string:artist>')
@@ -779,6 +805,59 @@ api.add_resource(LastPlayedByAlbum, '/last_played/album=<string:album>')
 api.add_resource(LastPlayedByTrack, '/last_played/track=<string:track>')
 
 
+# -=-=-=-=-=-=-=-=-=-=-=- REST API: Typeahead -=-=-=-=-=-=-=-=-=-=-=-
+# http://0.0.0.0:5000/typeahead/artist=pink%20f
+# http://0.0.0.0:5000/typeahead/album=dark%20side
+# http://0.0.0.0:5000/typeahead/track=ecl
+
+
+class TypeaheadSchema(ma.Schema):
+    class Meta:
+        fields = ("name", "plays")
+
+
+typeahead_schema = TypeaheadSchema(many=True)
+
+
+@swagger.model
+class Typeahead(Resource):
+    "Artists, Albums or Tracks starting with what's been typed"
+
+    @swagger.operation(
+        notes="Most played names starting with the prefix",
+        responseClass=PlaylistTrack.__name__,
+        nickname='typeahead',
+        parameters=[
+            {
+                "name": "body",
+                "description": "blueprint object that needs to be added. YAML.",
+                "required": True,
+                "allowMultiple": False,
+                "dataType": PlaylistTrack.__name__,
+                "paramType": "body"
+            }
+        ],
+        responseMessages=[
+            {
+                "code": 201,
+                "message": "Created. created blueprint URL in Location header"
+            },
+            {
+                "code": 405,
+                "message": "Invalid input"
+            }
+        ]
+    )
+    def get(self, media: str, prefix: str) -> List[Dict[str, Any]]:
+        suggestions = search_index.typeahead(media=media, prefix=prefix)
+        return typeahead_schema.dump(
+            [suggestion._asdict() for suggestion in suggestions])
+
+
+api.add_resource(
+    Typeahead, '/typeahead/<any(artist, album, track):media>=<string:prefix>')
+
+
 # -=-=-=-=-=-=-=-=-=-=-=- REST API: Top Ten -=-=-=-=-=-=-=-=-=-=-=-
 # http://0.0.0.0:5000/top_plays/top=5&order_by=artist&start_date=2020-01-02&end_date=2020-01-10
 # http://0.0.0.0:5000/top_plays/top=5&order_by=artists&start_date=2021-01-02&end_date=2021-01-10
@@ -895,7 +974,7 @@ class DJStatsNoArgs(Resource):
         ]
     )
     def get(self) -> List[Dict[str, Any]]:
-        dj_stats = playlists.get_djs_alphabetically()
+        dj_stats = djs.dj_directory.get().stats  # Already by air_name.
         return dj_stats_schema.jsonify(dj_stats)
 
 
@@ -932,16 +1011,21 @@ class DJStats(Resource):
             self, order_by: str = 'air_name', reverse: int = 1
     ) -> List[Dict[str, Any]]:
         # Use 0, 1 for reverse
+        directory = djs.dj_directory.get()
         if order_by in ['dj_id', 'id']:
-            dj_stats = playlists.get_djs_by_dj_id(reverse=reverse)
+            dj_stats = directory.sorted_stats('dj_id', reverse=bool(reverse))
         elif order_by in ['first_show', 'firstshow']:
-            dj_stats = playlists.get_djs_by_first_show(reverse=reverse)
+            dj_stats = directory.sorted_stats(
+                'firstshow', reverse=bool(reverse))
         elif order_by in ['last_show', 'lastshow']:
-            dj_stats = playlists.get_djs_by_last_show(reverse=reverse)
+            dj_stats = directory.sorted_stats(
+                'lastshow', reverse=bool(reverse))
         elif order_by in ['show_count', 'showcount', 'shows', 'playlists']:
-            dj_stats = playlists.get_djs_by_show_count(reverse=reverse)
+            dj_stats = directory.sorted_stats(
+                'showcount', reverse=bool(reverse))
         else:
-            dj_stats = playlists.get_djs_alphabetically(reverse=reverse)
+            dj_stats = directory.sorted_stats(
+                'air_name', reverse=bool(reverse))
         return dj_stats_schema.jsonify(dj_stats)
 
 
@@ -1069,6 +1153,8 @@ api.add_resource(ArtistsAlbums, '/artists_albums/artist=<string:artist>')
 
 if __name__ == "__main__":
     connect_to_db(app)
+    djs.dj_directory.get()  # Warm these before the first visitor.
+    search_index.refresh_typeahead()
     # DebugToolbarExtension(app)
     app.jinja_env.auto_reload = True
     app.config['TEMPLATES_AUTO_RELOAD'] = False
@@ -252,6 +252,40 @@ function trackLastPlays(evt) {
   });
 }
 
+//  -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=- Typeahead -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+for (const media_type of ['artist', 'album', 'track']) {
+  document.querySelector(`#${media_type}-last-plays-string`).addEventListener(
+    "input", evt => suggestNames(evt, media_type));
+}
+
+function suggestNames(evt, media_type) {
+  const prefix = evt.target.value;
+  const datalist = document.querySelector(`#${media_type}-suggestions`);
+  if (prefix.trim().length == 0) {
+    datalist.innerHTML = "";
+    return;
+  }
+  const url = `/typeahead/${media_type}=${encodeURIComponent(prefix)}`;
+
+  fetch(url)
+  .then(response => response.ok ? response.json() : [])
+  .then(suggestions => {
+    if (evt.target.value != prefix) {
+      return;  // They kept typing; a newer list is on its way.
+    }
+    datalist.innerHTML = "";
+    for (const suggestion of suggestions) {
+      const option = document.createElement("option");
+      option.value = suggestion.name;
+      datalist.appendChild(option);
+    }
+  })
+  .catch(() => {
+    datalist.innerHTML = "";  // No suggestions is better than stale ones.
+  });
+}
+
 //  -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=- Top Plays -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
 document.querySelector("#top-plays").addEventListener("submit", topPlays);
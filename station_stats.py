@@ -0,0 +1,111 @@
+"""Station Data stats for the homepage, counted once per import."""
+
+from datetime import datetime
+from typing import NamedTuple, Optional, Union
+
+from model import db, connect_to_db, StationStat
+import playlists
+import playlist_tracks
+import common
+
+STATION_STATS_SECONDS = 3600  # How often the server re-reads the table.
+
+
+class StationStats(NamedTuple):
+    first_show: datetime
+    last_show: datetime
+    shows: int
+    djs: int
+    tracks: int
+
+
+def count_station_stats() -> StationStats:
+    """The full-table counts. Slow: run at the end of an import."""
+
+    first_show, last_show = playlists.first_show_last_show()
+    return StationStats(
+        first_show=first_show,
+        last_show=last_show,
+        shows=playlists.how_many_shows(),
+        djs=playlists.how_many_djs(),
+        tracks=playlist_tracks.how_many_tracks())
+
+
+def refresh_station_stats() -> StationStats:
+    """Recount and store the stats. Run at the end of every import."""
+
+    stats = store_station_stats(count_station_stats())
+    greeting_stats.clear()
+    return stats
+
+
+def store_station_stats(stats: StationStats) -> StationStats:
+    for name, value in stats._asdict().items():
+        db.session.merge(StationStat(name=name, value=stat_to_text(value)))
+    db.session.commit()
+    return stats
+
+
+def read_station_stats() -> Optional[StationStats]:
+    """The stored stats, or None if they were never counted."""
+
+    values = dict(db.session.query(StationStat.name, StationStat.value))
+    if not set(StationStats._fields) <= set(values):
+        return None
+    return StationStats(**{
+        name: text_to_stat(text=values[name], stat_type=stat_type)
+        for name, stat_type in StationStats.__annotations__.items()})
+
+
+def stat_to_text(value: Union[int, datetime, None]) -> Optional[str]:
+    """
+    >>> stat_to_text(datetime(2022, 2, 16, 2, 0, 30))
+    '2022-02-16T02:00:30'
+    >>> stat_to_text(1000000)
+    '1000000'
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def text_to_stat(
+        text: Optional[str], stat_type: type) -> Union[int, datetime, None]:
+    """
+    >>> text_to_stat('2022-02-16T02:00:30', datetime)
+    datetime.datetime(2022, 2, 16, 2, 0, 30)
+    >>> text_to_stat('1000000', int)
+    1000000
+    """
+    if text is None:
+        return None
+    if stat_type is datetime:
+        return datetime.fromisoformat(text)
+    return int(text)
+
+
+def load_station_stats() -> StationStats:
+    """The station_stats table, or counted here just once if no import
+    has stored them yet."""
+
+    return read_station_stats() or store_station_stats(count_station_stats())
+
+
+# Re-read every STATION_STATS_SECONDS, so a weekly_update shows up
+# without a restart.
+greeting_stats = common.SharedCache(
+    load=load_station_stats, max_seconds=STATION_STATS_SECONDS)
+
+
+if __name__ == '__main__':
+    """Will connect you to the database when you run
+    station_stats.py interactively"""
+    from server import app
+
+    connect_to_db(app)
+
+    import doctest
+
+    doctest.testmod()  # python3 station_stats.py -v
@@ -1,11 +1,14 @@
 """Tests for the KFJC Trivia Robot"""
 
+import os
+import tempfile
 import unittest
 import datetime
 
 from server import app
 from model import db, connect_to_db
 import import_station_data
+import bulk_import
 import djs
 import playlists
 import playlist_tracks
@@ -14,6 +17,8 @@ import tracks
 import users
 import questions
 import answers
+import station_stats
+import search_index
 import common
 
 TEST_USERS_DATA_PATH = 'test_data/fake_users.json'
@@ -62,18 +67,36 @@ class RobotTestsDatabase(unittest.TestCase):
         ["/album_tracks/331805", b"Hoochie Coochie Man"],
         ["/artists_albums/artist=meditations", b"Greatest Hits"],
         ["/artists_albums/artist=Jonestown%20Massacre", b"Zero"],
-        ["/artists_albums/artist=Harry", b"Love"]]
+        ["/artists_albums/artist=Harry", b"Love"],
+        ["/typeahead/artist=the%20med", b"The Meditations"]]
 
     def setUp(self):
         """Stuff that runs before every def test_ function."""
 
         self.client = app.test_client()
         app.config['TESTING'] = True
+        self.chunk_size = import_station_data.CHUNK_SIZE  # Tests shrink it.
+        self.run_ids = search_index.SEARCH_INDEX_RUN_IDS  # This one too.
 
         connect_to_db(flask_app=app, db_uri=f"postgresql:///{TEST_DB_NAME}")
         db.drop_all()
         db.create_all()
 
+    def use_test_station_data(self):
+        """Overwrite default paths."""
+        import_station_data.DJ_DATA_PATH = (
+            TEST_DJ_DATA_PATH)
+        import_station_data.PLAYLIST_DATA_PATH = (
+            TEST_PLAYLIST_DATA_PATH)
+        import_station_data.PLAYLIST_TRACK_DATA_PATH = (
+            TEST_PLAYLIST_TRACK_DATA_PATH)
+        import_station_data.ALBUM_DATA_PATH = (
+            TEST_ALBUM_DATA_PATH)
+        import_station_data.TRACK_DATA_PATH = (
+            TEST_TRACK_DATA_PATH)
+        import_station_data.COLLECTION_TRACK_DATA_PATH = (
+            TEST_COLLECTION_TRACK_DATA_PATH)
+
     def make_users(self):
         """Add users from self.test_data."""
         for one_user in self.test_data["users"]:
@@ -86,19 +109,16 @@ class RobotTestsDatabase(unittest.TestCase):
         """Make 3 answers for each user: One PASS, FAIL, SKIP."""
         question = questions.get_question_by_id(question_id=1)
         cheat_peek_at_answer = question.acceptable_answer
+        made = []
         for each_user in users.get_users():
-            answers.create_answer(
-                user_instance=each_user,
-                question_instance=question,
-                answer_given='SKIP')
-            answers.create_answer(
-                user_instance=each_user,
-                question_instance=question,
-                answer_given='wrong answer')
-            answers.create_answer(
-                user_instance=each_user,
-                question_instance=question,
-                answer_given=cheat_peek_at_answer)
+            for answer_given in ['SKIP', 'wrong answer', cheat_peek_at_answer]:
+                made.append(answers.create_answer(
+                    user_instance=each_user,
+                    question_instance=question,
+                    answer_given=answer_given))
+        db.session.commit()
+        for answer in made:
+            answers.answer_committed(answer=answer)
 
     def test_kfjc_trivia_robot_parts(self):
         """
@@ -110,23 +130,41 @@ class RobotTestsDatabase(unittest.TestCase):
         https://medium.com/@dirk.avery/pytest-modulenotfounderror-no-module-named-requests-a770e6926ac5
         """
 
-        # Overwrite default paths:
-        import_station_data.DJ_DATA_PATH = (
-            TEST_DJ_DATA_PATH)
-        import_station_data.PLAYLIST_DATA_PATH = (
-            TEST_PLAYLIST_DATA_PATH)
-        import_station_data.PLAYLIST_TRACK_DATA_PATH = (
-            TEST_PLAYLIST_TRACK_DATA_PATH)
-        import_station_data.ALBUM_DATA_PATH = (
-            TEST_ALBUM_DATA_PATH)
-        import_station_data.TRACK_DATA_PATH = (
-            TEST_TRACK_DATA_PATH)
-        import_station_data.COLLECTION_TRACK_DATA_PATH = (
-            TEST_COLLECTION_TRACK_DATA_PATH)
+        self.use_test_station_data()
+
+        # The chunker walks each file once and skips the header row:
+        import_station_data.CHUNK_SIZE = 5
+        chunks = list(import_station_data.read_raw_chunks(
+            file_path=TEST_PLAYLIST_DATA_PATH))
+        self.assertEqual(4, len(chunks))
+        self.assertEqual([1, 2, 3, 4], [chunk.number for chunk in chunks])
+        self.assertEqual(18, sum(len(chunk.rows()) for chunk in chunks))
+        # Picked up after chunk 2, the last two chunks come out the same:
+        checkpoint = import_station_data.Checkpoint(
+            chunk_number=2, byte_offset=chunks[1].end_offset,
+            row_count=sum(len(chunk.rows()) for chunk in chunks[:2]),
+            file_signature='')
+        self.assertEqual(chunks[2:], list(import_station_data.read_raw_chunks(
+            file_path=TEST_PLAYLIST_DATA_PATH, start=checkpoint)))
+        import_station_data.CHUNK_SIZE = 50  # Import in several chunks.
 
         # Import Station Data:
         import_station_data.import_all_tables()
 
+        # The pre-pass found album 0; nothing is missing any more:
+        self.assertIsNotNone(albums.get_album_by_id(kfjc_album_id=0))
+        self.assertEqual(
+            {'djs': [], 'albums': [], 'playlists': []},
+            import_station_data.find_missing_parents(
+                cache=import_station_data.import_cache))
+
+        # Each file is checkpointed past its last row, so resuming a
+        # finished import adds nothing:
+        self.assertEqual(18, import_station_data.import_cache.checkpoints[
+            'playlist.csv'].row_count)
+        import_station_data.import_all_tables(resume=True)
+        self.assertEqual(18, playlists.how_many_shows())
+
         self.assertTrue(
             albums.get_album_by_id(kfjc_album_id=694447).is_collection)
         self.assertFalse(
@@ -172,6 +210,23 @@ class RobotTestsDatabase(unittest.TestCase):
                 start_date='2022-01-10', end_date='2002-01-02',
                 n=5)[0].track_title)
 
+        # Adding up whole weeks gives the same Top Plays as counting them:
+        top_tracks = playlist_tracks.get_top10_tracks(
+            start_date='2002-01-02', end_date='2022-01-10', n=100)
+        top_albums = playlist_tracks.get_top10_albums(
+            start_date='2002-01-02', end_date='2022-01-10', n=100)
+        top_artists = playlist_tracks.get_top10_artists(
+            start_date='2019-10-02', end_date='2019-11-27', n=100)
+        playlist_tracks.refresh_weekly_plays()
+        self.assertTrue(playlist_tracks.rolled_up_weeks(
+            start_date='2002-01-02', end_date='2022-01-10'))
+        self.assertEqual(top_tracks, playlist_tracks.get_top10_tracks(
+            start_date='2002-01-02', end_date='2022-01-10', n=100))
+        self.assertEqual(top_albums, playlist_tracks.get_top10_albums(
+            start_date='2002-01-02', end_date='2022-01-10', n=100))
+        self.assertEqual(top_artists, playlist_tracks.get_top10_artists(
+            start_date='2019-10-02', end_date='2019-11-27', n=100))
+
         self.assertEqual(
             'The Meditations',
             playlist_tracks.get_favorite_artists(
@@ -191,7 +246,29 @@ class RobotTestsDatabase(unittest.TestCase):
         self.assertIn(
             playlist_tracks.get_a_random_track(min_appearances=5),
             ["Zion Train Dub"])
+        playlist_tracks.refresh_library_picks()  # Same picks, no grouping:
+        self.assertIn(
+            playlist_tracks.get_a_random_artist(min_appearances=6),
+            ['The Meditations', "Delixx"])
+        self.assertIn(
+            playlist_tracks.get_a_random_track(min_appearances=5),
+            ["Zion Train Dub"])
+        self.assertIsInstance(
+            playlist_tracks.get_a_random_kfjc_album_id(), int)
+        three_artists = playlist_tracks.sample_library(
+            pick_type='artist', k=3, min_appearances=1,
+            exclude=['The Meditations'])
+        self.assertEqual(3, len(set(three_artists)))
+        self.assertNotIn('The Meditations', three_artists)
+        self.assertEqual(
+            'The Meditations',
+            search_index.typeahead(media='artist', prefix='the med')[0].name)
 
+        playlist_tracks.create_playlist_tracks_indexes()
+        self.assertEqual(3, db.session.execute(
+            """SELECT COUNT(*) FROM pg_indexes
+            WHERE tablename = 'playlist_tracks'
+            AND indexname LIKE '%_trgm' """).scalar())
         self.assertEqual(
             "Dr Doug",
             playlist_tracks.get_last_play_of_artist(
@@ -213,6 +290,42 @@ class RobotTestsDatabase(unittest.TestCase):
             playlist_tracks.get_last_play_of_artist(
                 artist=" h i p  h o p ")[0].artist)
 
+        # The same searches, narrowed down by the trigram index:
+        for artist in ["Hop Along", "Bishop Nehru"]:
+            playlist_tracks.create_playlist_track(
+                kfjc_playlist_id=60706, indx=99, kfjc_album_id=None,
+                album_title="Shadows on the Sun", artist=artist,
+                track_title="Star Quality", time_played="2019-11-26 03:00:00")
+        db.session.commit()
+        search_index.SEARCH_INDEX_RUN_IDS = 50  # Merge several runs.
+        search_index.names_index = search_index.SearchIndexFile(
+            search_index.build_search_index(path=os.path.join(
+                tempfile.mkdtemp(), 'search_index.bin')))
+        hop_artists = [
+            last_play.artist for last_play in
+            playlist_tracks.get_last_play_of_artist(artist="hop")]
+        self.assertIn("Hop Along", hop_artists)  # At the start of a word,
+        self.assertIn("Bishop Nehru", hop_artists)  # and in the middle.
+        self.assertIn("BLM - Rock and Hip Hop", hop_artists)
+        self.assertEqual([], search_index.matching_ids(
+            field='artist', query='zzyzx'))
+        self.assertTrue(search_index.matching_ids(
+            field='album_title', query='shadows sun'))
+        self.assertEqual(
+            "Dr Doug",
+            playlist_tracks.get_last_play_of_album(
+                album="Shadows on the Sun")[0].air_name)
+        for artist in ["hip  hop", " h i p  h o p "]:
+            self.assertEqual(
+                "BLM - Rock and Hip Hop",
+                playlist_tracks.get_last_play_of_artist(
+                    artist=artist)[0].artist)
+        search_index.names_index = search_index.SearchIndexFile(
+            search_index.SEARCH_INDEX_PATH)
+        db.session.execute(
+            "DELETE FROM playlist_tracks WHERE indx = 99;")
+        db.session.commit()
+
         # Also tests: common.get_count(table_dot_column, unique=True)
         self.assertEqual(97, playlist_tracks.how_many_tracks())
 
@@ -268,8 +381,20 @@ class RobotTestsDatabase(unittest.TestCase):
             dj_id=41, posessive=False))
         self.assertEqual("♡ Cy Thoth's ♡", djs.get_airname_for_dj(
             dj_id=41, posessive=True))
+        air_names = djs.get_all_airnames()
+        self.assertEqual(
+            ("♡ Cy Thoth ♡", "♡ Cy Thoth's ♡"), tuple(air_names[41]))
+        self.assertEqual("Sir Cumference's", air_names[255].posessive)
+        directory = djs.dj_directory.refresh()
+        self.assertEqual("♡ Cy Thoth ♡", directory.dj_dict[41]['air_name'])
+        self.assertEqual(
+            len(playlists.get_djs_alphabetically()),
+            len(directory.dj_airnames))
 
         self.assertEqual(18, playlists.how_many_shows())
+        stats = station_stats.refresh_station_stats()
+        self.assertEqual((18, 7, 97), (stats.shows, stats.djs, stats.tracks))
+        self.assertEqual(stats, station_stats.greeting_stats.get())
 
         for track in tracks.get_tracks_by_kfjc_album_id(kfjc_album_id=397830):
             self.assertEqual('Dolly Parton', track.artist)
@@ -302,6 +427,16 @@ class RobotTestsDatabase(unittest.TestCase):
         questions.make_all_questions()
 
         self.make_answers()
+        # An answer that never commits is not remembered:
+        questions.unseen_questions.clear()
+        questions.unseen_questions.draw(user_id=5)  # Caches Percy's bitmap.
+        answers.create_answer(
+            user_instance=users.get_user_by_id(user_id=5),
+            question_instance=questions.get_question_by_id(question_id=2),
+            answer_given='SKIP')
+        db.session.rollback()
+        self.assertFalse(questions.has_bit(
+            bitmap=questions.unseen_questions.answered[5], index=2))
         # Also tests: answers.is_answer_correct(
         #   question_instance, answer_given)
         percys_score = answers.get_user_score(user_id=5)
@@ -310,7 +445,22 @@ class RobotTestsDatabase(unittest.TestCase):
         self.assertEqual(1, percys_score.skipped)
         self.assertEqual(3, percys_score.questions)
         self.assertEqual(50, percys_score.percent)
+        answers.rebuild_user_scores()  # Recount from answers; same score.
+        self.assertEqual(percys_score, answers.get_user_score(user_id=5))
+        leaders = answers.compile_leaderboard(top_n=2)
+        self.assertEqual(2, len(leaders))
+        self.assertGreaterEqual(leaders[0][1], leaders[1][1])
+        # The leaderboard and /score round a percent the same way:
+        for score in answers.get_scores():
+            self.assertEqual(score.percent, answers.get_user_score(
+                user_id=score.user_id).percent)
         self.assertNotEqual(1, questions.get_unique_question(user_id=5))
+        # Only question 1 has been answered, so it never comes back:
+        for _ in range(10):
+            self.assertNotEqual(
+                1, questions.get_unique_question(user_id=5).question_id)
+            self.assertNotEqual(1, questions.get_unique_question_from_db(
+                user_id=5).question_id)
 
         result = self.client.post(
             "/login",
@@ -326,12 +476,94 @@ class RobotTestsDatabase(unittest.TestCase):
             print("jem", each_test, result.data)
             self.assertIn(each_test[1], result.data)
 
+        # A page at a time, then all at once as NDJSON:
+        last_plays = self.client.get(
+            "/last_played/artist=meditations").get_json()
+        result = self.client.get(
+            "/last_played/artist=meditations?page_size=2")
+        self.assertEqual(last_plays[:2], result.get_json())
+        result = self.client.get(
+            "/last_played/artist=meditations?page_size=2&after="
+            + result.headers["X-Next-Cursor"])
+        self.assertEqual(last_plays[2:4], result.get_json())
+        result = self.client.get(
+            "/last_played/artist=meditations?format=ndjson")
+        self.assertEqual(len(last_plays), len(result.data.splitlines()))
+        self.assertEqual(400, self.client.get(
+            "/last_played/artist=meditations?after=yesterday").status_code)
+        for page_size in [0, -1]:
+            self.assertEqual(400, self.client.get(
+                f"/last_played/artist=meditations?format=ndjson&"
+                f"page_size={page_size}").status_code)
+
+        answers.leaderboard.clear()  # Snapshots outlive each test's tables.
+        result = self.client.get("/rest_leaderboard")
+        self.assertIn(b"Percy", result.data)
+        result = self.client.get(
+            "/rest_leaderboard",
+            headers={"If-None-Match": result.headers["ETag"]})
+        self.assertEqual(304, result.status_code)
+
+    def test_copy_import(self):
+        """The COPY engine should land the same rows as the ORM import."""
+        self.use_test_station_data()
+        bulk_import.import_all_tables_with_copy()
+
+        self.assertEqual(97, playlist_tracks.how_many_tracks())
+        self.assertEqual(18, playlists.how_many_shows())
+        self.assertTrue(
+            albums.get_album_by_id(kfjc_album_id=694447).is_collection)
+        self.assertNotIn(
+            "Fuck", albums.get_album_by_id(kfjc_album_id=140533).title)
+        self.assertEqual("♡ Cy Thoth ♡", djs.get_airname_for_dj(
+            dj_id=41, posessive=False))
+        for track in tracks.get_tracks_by_kfjc_album_id(kfjc_album_id=397830):
+            self.assertEqual('Dolly Parton', track.artist)
+
+        # Every chunk of album.csv is in the manifest; reruns skip them:
+        cache = import_station_data.ImportCache()
+        cache.preload()
+        self.assertEqual([], list(import_station_data.read_changed_chunks(
+            file_path=TEST_ALBUM_DATA_PATH, cache=cache)))
+
+        # Outside a delta import, a chunk that changed since it was
+        # loaded is refused rather than loaded on top of its old rows:
+        import_station_data.CHUNK_SIZE = 5  # Every chunk reads differently.
+        with self.assertRaises(ValueError):
+            bulk_import.import_all_tables_with_copy()
+        import_station_data.CHUNK_SIZE = self.chunk_size
+        self.assertEqual(97, playlist_tracks.how_many_tracks())
+
+        # A delta import of the same files changes nothing and
+        # leaves the users alone:
+        self.make_users()
+        user_count = len(users.get_users())
+        bulk_import.import_new_rows_with_copy()
+        self.assertEqual(97, playlist_tracks.how_many_tracks())
+        self.assertEqual(18, playlists.how_many_shows())
+        self.assertEqual(user_count, len(users.get_users()))
+
+        # An album that changed in album.csv is merged by a delta import:
+        title = albums.get_album_by_id(kfjc_album_id=140533).title
+        db.session.execute(
+            "UPDATE albums SET title = 'Old Title' "
+            "WHERE kfjc_album_id = 140533;")
+        db.session.execute(
+            "UPDATE imported_chunks SET content_hash = 'changed' "
+            "WHERE file_name = 'album.csv';")
+        db.session.commit()
+        bulk_import.import_new_rows_with_copy()
+        self.assertEqual(
+            title, albums.get_album_by_id(kfjc_album_id=140533).title)
+
     def tearDown(self):
         """Stuff that runs after every def test_ function."""
 
         db.session.close()
         # Test Data is purged at the end of each test:
         db.drop_all()
+        import_station_data.CHUNK_SIZE = self.chunk_size
+        search_index.SEARCH_INDEX_RUN_IDS = self.run_ids
 
 
 if __name__ == "__main__":
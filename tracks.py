@@ -1,6 +1,7 @@
 """Track operations for KFJC Trivia Robot."""
 
 from model import db, connect_to_db, Track
+import search_index
 import common
 
 
@@ -34,11 +35,19 @@ def get_tracks_by_kfjc_album_id(kfjc_album_id):
 def get_tracks_by_an_artist(artist):
     """Might go with a LOWER(LIKE '%%') inclusive search.   """
 
+    candidate_ids = search_index.matching_ids(
+        field='tracks.artist', query=artist)
+    only_candidates = ""
+    if candidate_ids is not None:
+        only_candidates = (  # IN (NULL) matches nothing.
+            f"AND id_ IN "
+            f"({', '.join(map(str, candidate_ids)) or 'NULL'})")
     artist = artist.replace(" ", "%")  # Get more hits.
     tracks_by_an_artist = (
         f""" SELECT kfjc_album_id, artist, title, indx
         FROM tracks
-        WHERE LOWER(artist) LIKE LOWER('%{artist}%') """)
+        WHERE LOWER(artist) LIKE LOWER('%{artist}%')
+        {only_candidates} """)
 
     results = db.session.execute(tracks_by_an_artist)
     reply_named_tuple = common.convert_list_o_dicts_to_list_o_named_tuples(